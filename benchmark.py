@@ -4,7 +4,14 @@ A quick way to asses the impact of certain changes.
 
 from __future__ import absolute_import, division, print_function
 
-from characteristic import attributes
+import pickle
+import sys
+import time
+
+from characteristic import (
+    Attribute, attributes, evolve_many, immutable, pack, unpack, with_cmp,
+    with_init,
+)
 
 
 class Artisanal(object):
@@ -24,6 +31,60 @@ class Defaults(object):
     pass
 
 
+@attributes(["a", "b", "c"], storage="slots")
+class Slots(object):
+    pass
+
+
+@attributes(["a", "b", "c"], storage="slots", weakref_slot=False)
+class SlotsNoWeakref(object):
+    pass
+
+
+@attributes(["a", "b", "c"], storage="tuple")
+class Tuple(object):
+    pass
+
+
+FIELDS = ["f{0}".format(i) for i in range(10)]
+VALUES = dict((name, i) for i, name in enumerate(FIELDS))
+
+
+@attributes(FIELDS)
+class TenFields(object):
+    pass
+
+
+@attributes(FIELDS, apply_immutable=True)
+class TenFieldsFrozen(object):
+    pass
+
+
+# Applying immutable() last makes the initializer go through the sentry.
+@immutable(FIELDS)
+@attributes(FIELDS)
+class TenFieldsSentry(object):
+    pass
+
+
+WIDE = ["id"] + [Attribute("f{0}".format(i), default_value=None)
+                 for i in range(80)]
+
+
+@attributes(WIDE)
+class Wide(object):
+    pass
+
+
+@attributes(WIDE, storage="sparse")
+class WideSparse(object):
+    pass
+
+
+NO_DEFAULTS = NoDefaults(a=1, b=2, c=3)
+TUPLE = (1, 2, 3)
+
+
 def bench_artisanal():
     Artisanal(a=1, b=2, c=3)
 
@@ -41,13 +102,261 @@ def bench_both():
     Defaults(a=1, b=2)
 
 
+def bench_hash():
+    hash(NO_DEFAULTS)
+
+
+def bench_hash_tuple():
+    hash(TUPLE)
+
+
+def bench_slots():
+    Slots(a=1, b=2, c=3)
+
+
+def bench_tuple():
+    Tuple(a=1, b=2, c=3)
+
+
+def bench_ten_fields():
+    TenFields(**VALUES)
+
+
+def bench_ten_fields_frozen():
+    TenFieldsFrozen(**VALUES)
+
+
+def bench_ten_fields_sentry():
+    TenFieldsSentry(**VALUES)
+
+
+def instance_size(obj):
+    """
+    Return the size of *obj* in bytes including its instance dictionary.
+    """
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def bench_pickle(n=1000000):
+    """
+    Compare pickling *n* instances as a list to pickling them packed.
+    """
+    objs = [NoDefaults(a=i, b=float(i), c=str(i)) for i in range(n)]
+    for name, dump, load in [
+        ("pickle", lambda: objs, lambda loaded: loaded),
+        ("pack", lambda: pack(NoDefaults, objs), unpack),
+    ]:
+        start = time.time()
+        data = pickle.dumps(dump(), pickle.HIGHEST_PROTOCOL)
+        dumped = time.time()
+        load(pickle.loads(data))
+        loaded = time.time()
+        print(
+            "bench_pickle {0}: {1} bytes, dump {2:.2f}s, load {3:.2f}s".format(
+                name, len(data), dumped - start, loaded - dumped,
+            )
+        )
+
+
+def bench_evolve_many(n=100000):
+    """
+    Compare evolve_many() to creating *n* changed instances.
+    """
+    objs = [TenFieldsFrozen(**VALUES) for _ in range(n)]
+    for name, func in [
+        ("init", lambda: [
+            TenFieldsFrozen(**dict(VALUES, f0=42)) for obj in objs
+        ]),
+        ("evolve_many", lambda: evolve_many(objs, f0=42)),
+    ]:
+        start = time.time()
+        func()
+        print("bench_evolve_many {0}: {1:.2f}s".format(
+            name, time.time() - start
+        ))
+
+
+def bench_pypy_variants(n=1000000):
+    """
+    Compare the default code to the variants that characteristic uses on
+    PyPy by instantiating immutable classes and comparing instances *n* times
+    each after a warm-up.  Run it on PyPy to see what the JIT makes of them.
+    """
+    import characteristic
+
+    detected = characteristic.PYPY
+    try:
+        for pypy in (False, True):
+            characteristic.PYPY = pypy
+
+            @immutable(["a", "b", "c"])
+            @with_cmp(["a", "b", "c"])
+            class C(object):
+                def __init__(self, a, b, c):
+                    self.a = a
+                    self.b = b
+                    self.c = c
+
+            x, y = C(1, 2, 3), C(1, 2, 3)
+            for name, func in [
+                ("init", lambda: C(1, 2, 3)),
+                ("eq", lambda: x == y),
+            ]:
+                for _ in range(n // 10):
+                    func()
+                start = time.time()
+                for _ in range(n):
+                    func()
+                print("bench_pypy_variants {0} {1}: {2:.2f}s".format(
+                    "pypy" if pypy else "default", name, time.time() - start,
+                ))
+    finally:
+        characteristic.PYPY = detected
+
+
+def bench_class_memory(n=10000):
+    """
+    Measure how many bytes each of *n* classes that are created on the fly
+    and decorated by attributes() occupies on top of an undecorated class.
+    Needs :mod:`tracemalloc`.
+    """
+    import gc
+    import tracemalloc
+
+    def traced(make):
+        make()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            classes = [make() for _ in range(n)]
+            gc.collect()
+            return (tracemalloc.get_traced_memory()[0] - before) / len(classes)
+        finally:
+            tracemalloc.stop()
+
+    def make_plain():
+        class C(object):
+            pass
+        return C
+
+    base = traced(make_plain)
+    for name, kw in [
+        ("mutable", {}),
+        ("immutable", {"apply_immutable": True}),
+    ]:
+        def make():
+            class C(object):
+                pass
+            return attributes(FIELDS, **kw)(C)
+
+        print("bench_class_memory {0}: {1:.0f} bytes per class".format(
+            name, traced(make) - base,
+        ))
+
+
+def bench_cold_start(n=2000, repeat=5):
+    """
+    Compare how long fresh interpreters take to import a module that
+    decorates *n* classes with distinct attributes with and without
+    importing a module written by emit_module() first.
+    """
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(tmp, "cold_models.py"), "w") as f:
+            f.write("from characteristic import Attribute, attributes\n")
+            for i in range(n):
+                f.write(
+                    "\n\n@attributes(['a{0}', 'b{0}', 'c{0}',\n"
+                    "             Attribute('d{0}', default_value=0),\n"
+                    "             Attribute('e{0}', instance_of=int,\n"
+                    "                       default_value=0)])\n"
+                    "class C{0}(object):\n"
+                    "    pass\n".format(i)
+                )
+        env = dict(os.environ)
+        # Cold starts are about cached bytecode, so it must be written.
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [tmp, os.path.dirname(os.path.abspath(__file__))]
+        )
+        subprocess.check_call([
+            sys.executable, "-c",
+            "import sys, characteristic; "
+            "characteristic.emit_module(['cold_models'], "
+            "open('cold_precompiled.py', 'w'))",
+        ], cwd=tmp, env=env)
+
+        for name, stmt in [
+            ("without emit_module", "import cold_models"),
+            ("with emit_module", "import cold_precompiled, cold_models"),
+        ]:
+            # The first run writes the .pyc files.
+            subprocess.check_call([sys.executable, "-c", stmt], env=env)
+            times = []
+            for _ in range(repeat):
+                start = time.time()
+                subprocess.check_call([sys.executable, "-c", stmt], env=env)
+                times.append(time.time() - start)
+            print("bench_cold_start {0}: {1:.3f}s".format(name, min(times)))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_decoration():
+    class C(object):
+        pass
+    with_init([Attribute("a"), Attribute("b"),
+               Attribute("c", default_value=42)])(C)
+
+
 if __name__ == "__main__":
     import timeit
 
     for func in ["bench_no_defaults", "bench_defaults", "bench_both",
-                 "bench_artisanal"]:
+                 "bench_artisanal", "bench_hash", "bench_hash_tuple",
+                 "bench_slots", "bench_tuple", "bench_ten_fields",
+                 "bench_ten_fields_frozen", "bench_ten_fields_sentry"]:
         print(
             func + ": ",
             timeit.timeit(func + "()",
                           setup="from __main__ import {}".format(func))
         )
+
+    # Decorating is a lot more expensive than instantiating, so run it less
+    # often.
+    print(
+        "bench_decoration: ",
+        timeit.timeit("bench_decoration()",
+                      setup="from __main__ import bench_decoration",
+                      number=10000)
+    )
+
+    if sys.version_info[0:2] >= (3, 4):
+        bench_class_memory()
+
+    bench_cold_start()
+
+    for cls in [NoDefaults, Slots, SlotsNoWeakref, Tuple]:
+        print(
+            cls.__name__ + " instance size: ",
+            instance_size(cls(a=1, b=2, c=3))
+        )
+
+    for cls in [Wide, WideSparse]:
+        print(
+            cls.__name__ + " instance size (2 of 81 attributes set): ",
+            instance_size(cls(id=1, f0=2))
+        )
+
+    bench_pickle()
+    bench_evolve_many()
+    bench_pypy_variants()
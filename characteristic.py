@@ -5,9 +5,23 @@ Python attributes without boilerplate.
 from __future__ import absolute_import, division, print_function
 
 import hashlib
+import inspect
+import json
+import keyword
 import linecache
+import mmap
+import os
+import re
+import struct
 import sys
+import threading
+import types
 import warnings
+import weakref
+
+from itertools import islice, repeat, starmap
+from operator import index, itemgetter
+from timeit import default_timer
 
 
 __version__ = "15.0.0-dev"
@@ -17,16 +31,37 @@ __copyright__ = "Copyright 2014 Hynek Schlawack"
 
 __all__ = [
     "Attribute",
+    "MappedRecords",
     "NOTHING",
+    "Pool",
+    "Schema",
     "attributes",
+    "deep_eq",
+    "diff",
+    "dump_jsonl",
+    "emit_module",
+    "evolve_many",
     "immutable",
+    "init_trace_report",
+    "instance_stats",
+    "load_jsonl",
+    "pack",
+    "record_struct",
+    "register_code",
+    "release_pooled",
+    "schema",
     "strip_leading_underscores",
+    "unpack",
+    "validate_columns",
     "with_cmp",
     "with_init",
     "with_repr",
+    "write_records",
 ]
 
 PY26 = sys.version_info[0:2] == (2, 6)
+PYPY = "__pypy__" in sys.builtin_module_names
+HAS_SIGNATURE = hasattr(inspect, "Signature")
 
 # I'm sorry. :(
 if sys.version_info[0] == 2:
@@ -111,6 +146,27 @@ class Attribute(object):
         Therefore, setting this makes an attribute *optional*.
     :type default_factory: callable
 
+    :param share_default: Call ``default_factory`` only *once* when the class
+        is decorated and share the result between all instances that don't
+        get a value passed.  Only use this for immutable values like an empty
+        :class:`frozenset` or a parsed configuration constant.
+    :type share_default: bool
+
+    :param async_default_factory: A factory that returns an awaitable whose
+        result is used as the default value by :func:`acreate` and
+        :func:`acreate_many` whenever this attribute isn't passed as a
+        keyword argument.  The regular initializer treats the attribute as
+        mandatory.
+    :type async_default_factory: callable
+
+    :param default_pool: A :class:`Pool` that default values are acquired
+        from whenever this attribute isn't passed as a keyword argument.
+        Use :func:`release_pooled` to give them back once an instance isn't
+        needed anymore.
+
+        Therefore, setting this makes an attribute *optional*.
+    :type default_pool: :class:`Pool`
+
     :param instance_of: If used together with :func:`with_init` (or
         :func:`attributes` with ``apply_with_init=True``), the passed value is
         checked whether it's an instance of the type passed here.  The
@@ -127,13 +183,29 @@ class Attribute(object):
 
     :raises ValueError: If both ``default_value`` and ``default_factory`` have
         been passed.
+    :raises ValueError: If ``async_default_factory`` has been passed together
+        with ``default_value`` or ``default_factory``.
+    :raises ValueError: If ``share_default`` has been passed without
+        ``default_factory``.
+    :raises ValueError: If ``default_pool`` has been passed together with
+        another kind of default.
 
     .. versionadded:: 14.0
+
+    .. versionadded:: 15.0
+        Added ``async_default_factory``.
+
+    .. versionadded:: 15.0
+        Added ``share_default``.
+
+    .. versionadded:: 15.0
+        Added ``default_pool``.
     """
     __slots__ = [
         "name", "exclude_from_cmp", "exclude_from_init", "exclude_from_repr",
         "exclude_from_immutable", "default_value", "default_factory",
-        "instance_of", "init_aliaser", "_kw_name",
+        "instance_of", "init_aliaser", "_kw_name", "async_default_factory",
+        "share_default", "default_pool",
     ]
 
     def __init__(self,
@@ -145,7 +217,10 @@ class Attribute(object):
                  default_value=NOTHING,
                  default_factory=None,
                  instance_of=None,
-                 init_aliaser=strip_leading_underscores):
+                 init_aliaser=strip_leading_underscores,
+                 async_default_factory=None,
+                 share_default=False,
+                 default_pool=None):
         if (
                 default_value is not NOTHING
                 and default_factory is not None
@@ -154,6 +229,27 @@ class Attribute(object):
                 "Passing both default_value and default_factory is "
                 "ambiguous."
             )
+        if async_default_factory is not None and (
+                default_value is not NOTHING
+                or default_factory is not None
+        ):
+            raise ValueError(
+                "Passing async_default_factory together with default_value "
+                "or default_factory is ambiguous."
+            )
+        if share_default is True and default_factory is None:
+            raise ValueError(
+                "share_default needs a default_factory to share."
+            )
+        if default_pool is not None and (
+                default_value is not NOTHING
+                or default_factory is not None
+                or async_default_factory is not None
+        ):
+            raise ValueError(
+                "Passing default_pool together with another default is "
+                "ambiguous."
+            )
 
         self.name = name
         self.exclude_from_cmp = exclude_from_cmp
@@ -164,6 +260,9 @@ class Attribute(object):
         self.default_value = default_value
         self.default_factory = default_factory
         self.instance_of = instance_of
+        self.async_default_factory = async_default_factory
+        self.share_default = share_default
+        self.default_pool = default_pool
 
         self.init_aliaser = init_aliaser
         if init_aliaser is not None:
@@ -182,7 +281,10 @@ class Attribute(object):
             self.exclude_from_immutable == other.exclude_from_immutable and
             self.default_value == other.default_value and
             self.default_factory == other.default_factory and
-            self.instance_of == other.instance_of
+            self.instance_of == other.instance_of and
+            self.async_default_factory == other.async_default_factory and
+            self.share_default == other.share_default and
+            self.default_pool == other.default_pool
         )
 
     def __ne__(self, other):
@@ -195,7 +297,9 @@ class Attribute(object):
             "{exclude_from_repr!r}, exclude_from_immutable="
             "{exclude_from_immutable!r}, default_value={default_value!r}, "
             "default_factory={default_factory!r}, instance_of={instance_of!r},"
-            " init_aliaser={init_aliaser!r})>"
+            " init_aliaser={init_aliaser!r}, async_default_factory="
+            "{async_default_factory!r}, share_default={share_default!r}, "
+            "default_pool={default_pool!r})>"
         ).format(
             name=self.name, exclude_from_cmp=self.exclude_from_cmp,
             exclude_from_init=self.exclude_from_init,
@@ -204,9 +308,133 @@ class Attribute(object):
             default_value=self.default_value,
             default_factory=self.default_factory, instance_of=self.instance_of,
             init_aliaser=self.init_aliaser,
+            async_default_factory=self.async_default_factory,
+            share_default=self.share_default,
+            default_pool=self.default_pool,
+        )
+
+
+class Pool(object):
+    """
+    A bounded pool of objects that are created by *factory*.
+
+    Pass it as ``default_pool`` to :class:`Attribute` to take the default
+    values of an attribute from the pool instead of creating new ones for
+    every instance.  Give them back using :func:`release_pooled`.
+
+    :param factory: Called without arguments to create a new object if the
+        pool is empty.
+    :type factory: callable
+
+    :param size: The maximum number of idle objects kept.  Objects that are
+        released into a full pool are dropped.
+    :type size: int
+
+    :param reset: Called with every released object before it's returned to
+        the pool.  If it raises an exception, the object is dropped and the
+        exception propagates.
+    :type reset: callable
+
+    :param thread_local: Keep a separate pool of at most *size* objects per
+        thread instead of sharing one between all threads using a lock.
+    :type thread_local: bool
+
+    .. versionadded:: 15.0
+    """
+    __slots__ = [
+        "factory", "size", "reset", "thread_local", "_lock", "_local",
+        "_shared",
+    ]
+
+    def __init__(self, factory, size=16, reset=None, thread_local=False):
+        if size < 0:
+            raise ValueError("size must not be negative.")
+        self.factory = factory
+        self.size = size
+        self.reset = reset
+        self.thread_local = thread_local
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shared = []
+
+    def _idle(self):
+        """
+        Return the list of idle objects of the current thread.
+        """
+        if not self.thread_local:
+            return self._shared
+        try:
+            return self._local.idle
+        except AttributeError:
+            idle = self._local.idle = []
+            return idle
+
+    def acquire(self):
+        """
+        Return an idle object or a new one if there is none.
+        """
+        idle = self._idle()
+        if self.thread_local:
+            if idle:
+                return idle.pop()
+        else:
+            with self._lock:
+                if idle:
+                    return idle.pop()
+        return self.factory()
+
+    def release(self, obj):
+        """
+        Reset *obj* and return it to the pool unless it's full.
+        """
+        if self.reset is not None:
+            self.reset(obj)
+        idle = self._idle()
+        if self.thread_local:
+            if len(idle) < self.size:
+                idle.append(obj)
+        else:
+            with self._lock:
+                if len(idle) < self.size:
+                    idle.append(obj)
+
+    def __len__(self):
+        """
+        Return the number of idle objects available to the current thread.
+        """
+        return len(self._idle())
+
+    def __repr__(self):
+        return (
+            "<Pool(factory={factory!r}, size={size!r}, reset={reset!r}, "
+            "thread_local={thread_local!r})>"
+        ).format(
+            factory=self.factory, size=self.size, reset=self.reset,
+            thread_local=self.thread_local,
         )
 
 
+def release_pooled(obj):
+    """
+    Return the values of all attributes of *obj* that have a ``default_pool``
+    to their pools.
+
+    *obj* must not use them anymore afterwards.  Values that have been passed
+    explicitly are released too, so only pass values into pooled attributes
+    that may be reused.
+
+    :param obj: An instance of a class decorated by :func:`attributes`.
+
+    :raises TypeError: If the class of *obj* hasn't been decorated by
+        :func:`attributes`.
+
+    .. versionadded:: 15.0
+    """
+    for a in _get_attributes(obj.__class__):
+        if a.default_pool is not None:
+            a.default_pool.release(getattr(obj, a.name))
+
+
 def _ensure_attributes(attrs, defaults):
     """
     Return a list of :class:`Attribute` generated by creating new instances for
@@ -247,7 +475,106 @@ def _ensure_attributes(attrs, defaults):
     return rv
 
 
-def with_cmp(attrs):
+# The methods added by with_cmp, with_repr, and immutable are shared by all
+# decorated classes and look up what to work on in a compact per-class
+# descriptor instead of closing over the attributes of every class.  That
+# keeps the memory footprint of each decorated class low.
+
+_CMP_VALUES = {}
+
+
+def _make_cmp_values(attrs):
+    """
+    Return a function that creates a tuple of the class of an object followed
+    by the values of *attrs*.
+
+    Leading with the class salts the hash per class such that instances of
+    different classes with equal values don't collide in mixed dicts.  The
+    function doesn't depend on the class, so all classes with the same
+    attribute names share it.
+    """
+    names = tuple(a.name for a in attrs)
+    try:
+        return _CMP_VALUES[names]
+    except KeyError:
+        values = _CMP_VALUES[names] = _make_function(
+            "cmp_values", _attrs_to_cmp_values_script(names),
+            _unique_filename("cmp", attrs), {},
+        )
+        return values
+
+
+def _attrs_to_cmp_values_script(names):
+    """
+    Return a valid Python script of a function that creates a tuple of the
+    class of an object followed by the values of the attributes *names*.
+    """
+    return """\
+def cmp_values(obj):
+    '''
+    Create a tuple of *obj*'s class and the values of its attributes.
+
+    Automatically created by characteristic.
+    '''
+    return (obj.__class__, {values})
+""".format(values="".join("obj.{0}, ".format(name) for name in names))
+
+
+def _eq(self, other):
+    if other is self:
+        return True
+    if other.__class__ is self.__class__:
+        values = self.__class__.__characteristic_cmp__
+        return values(self) == values(other)
+    else:
+        return NotImplemented
+
+
+def _ne(self, other):
+    result = self.__class__.__eq__(self, other)
+    if result is NotImplemented:
+        return NotImplemented
+    else:
+        return not result
+
+
+def _lt(self, other):
+    if other.__class__ is self.__class__:
+        values = self.__class__.__characteristic_cmp__
+        return values(self) < values(other)
+    else:
+        return NotImplemented
+
+
+def _le(self, other):
+    if other.__class__ is self.__class__:
+        values = self.__class__.__characteristic_cmp__
+        return values(self) <= values(other)
+    else:
+        return NotImplemented
+
+
+def _gt(self, other):
+    if other.__class__ is self.__class__:
+        values = self.__class__.__characteristic_cmp__
+        return values(self) > values(other)
+    else:
+        return NotImplemented
+
+
+def _ge(self, other):
+    if other.__class__ is self.__class__:
+        values = self.__class__.__characteristic_cmp__
+        return values(self) >= values(other)
+    else:
+        return NotImplemented
+
+
+def _hash(self):
+    return hash(self.__class__.__characteristic_cmp__(self))
+
+
+def with_cmp(attrs, eq=True, order=True, hash=True):
     """
     A class decorator that adds comparison methods and a hashing method based
     on *attrs*.
@@ -257,90 +584,58 @@ def with_cmp(attrs):
     True iff objectA's tuple of *attrs* == objectB's tuple of *attrs*.
     But only instances of *identical* classes are compared!
 
-    :param attrs: Attributes to work with.
-    :type attrs: :class:`list` of :class:`str` or :class:`Attribute`\ s.
-    """
-    def attrs_to_tuple(obj):
-        """
-        Create a tuple of all values of *obj*'s *attrs*.
-        """
-        return tuple(getattr(obj, a.name) for a in attrs)
-
-    def eq(self, other):
-        """
-        Automatically created by characteristic.
-        """
-        if other.__class__ is self.__class__:
-            return attrs_to_tuple(self) == attrs_to_tuple(other)
-        else:
-            return NotImplemented
-
-    def ne(self, other):
-        """
-        Automatically created by characteristic.
-        """
-        result = eq(self, other)
-        if result is NotImplemented:
-            return NotImplemented
-        else:
-            return not result
+    Just like with tuples, an instance is always equal to itself without
+    looking at its attributes.
 
-    def lt(self, other):
-        """
-        Automatically created by characteristic.
-        """
-        if other.__class__ is self.__class__:
-            return attrs_to_tuple(self) < attrs_to_tuple(other)
-        else:
-            return NotImplemented
+    On PyPy, equality is checked attribute by attribute using generated
+    straight-line code instead of building tuples.
 
-    def le(self, other):
-        """
-        Automatically created by characteristic.
-        """
-        if other.__class__ is self.__class__:
-            return attrs_to_tuple(self) <= attrs_to_tuple(other)
-        else:
-            return NotImplemented
+    :param attrs: Attributes to work with.
+    :type attrs: :class:`list` of :class:`str` or :class:`Attribute`\ s.
 
-    def gt(self, other):
-        """
-        Automatically created by characteristic.
-        """
-        if other.__class__ is self.__class__:
-            return attrs_to_tuple(self) > attrs_to_tuple(other)
-        else:
-            return NotImplemented
+    :param eq: Add ``__eq__`` and ``__ne__``.
+    :type eq: bool
 
-    def ge(self, other):
-        """
-        Automatically created by characteristic.
-        """
-        if other.__class__ is self.__class__:
-            return attrs_to_tuple(self) >= attrs_to_tuple(other)
-        else:
-            return NotImplemented
+    :param order: Add ``__lt__``, ``__le__``, ``__gt__``, and ``__ge__``.
+    :type order: bool
 
-    def hash_(self):
-        """
-        Automatically created by characteristic.
-        """
-        return hash(attrs_to_tuple(self))
+    :param hash: Add ``__hash__``.  If *eq* is `True` but *hash* is `False`,
+        ``__hash__`` is set to `None` which makes instances unhashable like
+        Python does for classes that define equality but no hash.  That's
+        the right choice for mutable classes.
+    :type hash: bool
 
+    .. versionadded:: 15.0
+        Added *eq*, *order*, and *hash*.
+    """
     def wrap(cl):
-        cl.__eq__ = eq
-        cl.__ne__ = ne
-        cl.__lt__ = lt
-        cl.__le__ = le
-        cl.__gt__ = gt
-        cl.__ge__ = ge
-        cl.__hash__ = hash_
+        cl.__characteristic_cmp__ = values
+        if eq is True:
+            cl.__eq__ = eq_method
+            cl.__ne__ = _ne
+        if order is True:
+            cl.__lt__ = _lt
+            cl.__le__ = _le
+            cl.__gt__ = _gt
+            cl.__ge__ = _ge
+        if hash is True:
+            cl.__hash__ = _hash
+        elif eq is True:
+            cl.__hash__ = None
 
         return cl
 
     attrs = [a
              for a in _ensure_attributes(attrs, NOTHING)
              if a.exclude_from_cmp is False]
+    values = _make_cmp_values(attrs)
+    if PYPY and eq is True:
+        eq_method = _make_function(
+            "characteristic_eq", _attrs_to_eq_script(attrs),
+            _unique_filename("eq", attrs), {},
+        )
+    else:
+        eq_method = _eq
     return wrap
 
 
@@ -352,27 +647,27 @@ def with_repr(attrs):
     :param attrs: Attributes to work with.
     :type attrs: ``list`` of :class:`str` or :class:`Attribute`\ s.
     """
-    def repr_(self):
-        """
-        Automatically created by characteristic.
-        """
-        return "<{0}({1})>".format(
-            self.__class__.__name__,
-            ", ".join(a.name + "=" + repr(getattr(self, a.name))
-                      for a in attrs)
-        )
-
     def wrap(cl):
-        cl.__repr__ = repr_
+        cl.__characteristic_repr__ = names
+        cl.__repr__ = _repr
         return cl
 
-    attrs = [a
-             for a in _ensure_attributes(attrs, NOTHING)
-             if a.exclude_from_repr is False]
+    names = tuple(a.name
+                  for a in _ensure_attributes(attrs, NOTHING)
+                  if a.exclude_from_repr is False)
     return wrap
 
 
-def with_init(attrs, **kw):
+def _repr(self):
+    return "<{0}({1})>".format(
+        self.__class__.__name__,
+        ", ".join(name + "=" + repr(getattr(self, name))
+                  for name in self.__class__.__characteristic_repr__)
+    )
+
+
+def with_init(attrs, track_instances=False, trace_init=False, sparse=False,
+              **kw):
     """
     A class decorator that wraps the ``__init__`` method of a class and sets
     *attrs* using passed *keyword arguments* before calling the original
@@ -390,10 +685,33 @@ def with_init(attrs, **kw):
     :param attrs: Attributes to work with.
     :type attrs: ``list`` of :class:`str` or :class:`Attribute`\ s.
 
+    :param track_instances: Count constructed and alive instances of the
+        class.  See :func:`instance_stats`.  If `False`, the initializer
+        doesn't do any extra work.  Instances of tracked classes have to be
+        weakly referenceable.
+    :type track_instances: bool
+
+    :param trace_init: Measure how long each step of initializing each
+        attribute takes.  See :func:`init_trace_report`.  Only meant for
+        debugging since it makes the initializer a lot slower.
+    :type trace_init: bool
+
+    :param sparse: Store default values and shared defaults on the class
+        and only store values in instances that aren't identical to them.
+        Makes instances of classes with many attributes that mostly keep
+        their default values a lot smaller.
+    :type sparse: bool
+
     :raises ValueError: If the value for a non-optional attribute hasn't been
         passed as a keyword argument.
     :raises ValueError: If both *defaults* and an instance of
         :class:`Attribute` has been passed.
+    :raises ValueError: If *sparse* is `True` and the class already has an
+        attribute of the same name as one whose default would be stored on
+        the class.
+
+    .. versionadded:: 15.0
+        Added ``track_instances``, ``trace_init``, and ``sparse``.
 
     .. deprecated:: 14.0
         Use :class:`Attribute` instead of ``defaults``.
@@ -410,188 +728,2130 @@ def with_init(attrs, **kw):
     # We cache the generated init methods for the same kinds of attributes.
     sha1 = hashlib.sha1()
     sha1.update(repr(attrs).encode("utf-8"))
-    unique_filename = "<characteristic generated init {0}>".format(
-        sha1.hexdigest()
-    )
+    digest = sha1.hexdigest()
 
-    script = _attrs_to_script(attrs)
-    locs = {}
-    bytecode = compile(script, unique_filename, "exec")
-    exec_(bytecode, {"NOTHING": NOTHING, "attrs": attrs}, locs)
-    init = locs["characteristic_init"]
+    globs = {"NOTHING": NOTHING, "attrs": attrs}
+    for i, a in enumerate(attrs):
+        if a.share_default is True:
+            globs["shared_{0}".format(i)] = a.default_factory()
 
     def wrap(cl):
-        cl.__original_init__ = cl.__init__
-        # In order of debuggers like PDB being able to step through the code,
-        # we add a fake linecache entry.
-        linecache.cache[unique_filename] = (
-            len(script),
-            None,
-            script.splitlines(True),
-            unique_filename
-        )
-        cl.__init__ = init
+        frozen = _is_frozen(cl)
+        # Immutable classes on PyPy don't inspect frames, so the initializer
+        # has to tell the sentry that the instance is being initialized.
+        mark = PYPY and hasattr(cl, "__characteristic_immutable__")
+        init_globs = globs
+        if (
+            track_instances is True or frozen is True or trace_init is True
+            or mark
+        ):
+            init_globs = dict(globs)
+        if track_instances is True:
+            init_globs["stats"] = _INSTANCE_STATS[cl] = _InstanceStats()
+        if frozen is True:
+            init_globs["sentry"] = cl.__setattr__
+            init_globs["object_setattr"] = object.__setattr__
+        if trace_init is True:
+            trace = _INIT_TRACES[cl] = _InitTrace()
+            init_globs["add"] = trace.add
+            init_globs["timer"] = default_timer
+        if mark:
+            init_globs["initializing"] = _INITIALIZING
+        unique_filename = "<characteristic generated {0}init {1}>".format(
+            ("marking " if mark else "")
+            + ("frozen " if frozen else "")
+            + ("tracked " if track_instances else "")
+            + ("traced " if trace_init else "")
+            + ("sparse " if sparse else ""),
+            digest,
+        )
+        if sparse is True:
+            for a in attrs:
+                if _has_class_default(a) and a.name in cl.__dict__:
+                    raise ValueError(
+                        "Sparse storage can't store the default of {0!r} on "
+                        "the class because the class already has an "
+                        "attribute of that name.".format(a.name)
+                    )
+            for i, a in enumerate(attrs):
+                if _has_class_default(a):
+                    setattr(cl, a.name, globs.get("shared_{0}".format(i),
+                                                  a.default_value))
+        cl.__original_init__ = _original(cl, "__init__", "characteristic_init")
+        cl.__init__ = _make_function(
+            "characteristic_init",
+            _attrs_to_script(attrs, track_instances=track_instances,
+                             frozen=frozen, trace_init=trace_init,
+                             sparse=sparse, mark=mark),
+            unique_filename,
+            init_globs,
+        )
+        _add_signature(cl.__init__, attrs, init_globs, cl.__original_init__)
         return cl
 
     return wrap
 
 
-_VALID_INITS = frozenset(["characteristic_init", "__init__"])
+class _InstanceStats(object):
+    """
+    Construction statistics of a class whose initializer tracks instances.
+    """
+    __slots__ = ["constructed", "refs"]
 
+    def __init__(self):
+        self.constructed = 0
+        # Weak references to alive instances that remove themselves.  They
+        # are keyed by their ids because weak references hash and compare
+        # like their referents, which may be equal or unhashable.
+        self.refs = {}
 
-def immutable(attrs):
+    def track(self, obj):
+        r = weakref.ref(obj, self._discard)
+        self.refs[id(r)] = r
+
+    def _discard(self, r):
+        self.refs.pop(id(r), None)
+
+
+_INSTANCE_STATS = weakref.WeakKeyDictionary()
+
+
+def instance_stats():
     """
-    Class decorator that makes *attrs* of a class immutable.
+    Return a snapshot of the statistics of all classes that are decorated
+    using :func:`with_init` with ``track_instances=True`` (or
+    :func:`attributes` with ``track_instances=True``).
 
-    That means that *attrs* can only be set from an initializer.  If anyone
-    else tries to set one of them, an :exc:`AttributeError` is raised.
+    :return: A dictionary that maps each tracked class to a dictionary with
+        the number of instances that have been ``"constructed"`` in total and
+        that are still ``"alive"``.
+    :rtype: dict
 
-    .. versionadded:: 14.0
+    .. versionadded:: 15.0
     """
-    # In this case, we just want to compare (native) strings.
-    attrs = frozenset(attr.name if isinstance(attr, Attribute) else attr
-                      for attr in _ensure_attributes(attrs, NOTHING)
-                      if attr.exclude_from_immutable is False)
+    return dict(
+        (cl, {"constructed": stats.constructed, "alive": len(stats.refs)})
+        for cl, stats in list(_INSTANCE_STATS.items())
+    )
 
-    def characteristic_immutability_sentry(self, attr, value):
-        """
-        Immutability sentry automatically created by characteristic.
 
-        If an attribute is attempted to be set from any other place than an
-        initializer, a TypeError is raised.  Else the original __setattr__ is
-        called.
-        """
-        prev = sys._getframe().f_back
-        if (
-            attr not in attrs
-            or
-            prev is not None and prev.f_code.co_name in _VALID_INITS
-        ):
-            self.__original_setattr__(attr, value)
+class _InitTrace(object):
+    """
+    Timings of the steps of a traced initializer.
+    """
+    __slots__ = ["steps"]
+
+    def __init__(self):
+        # (attribute name, step) -> [calls, total seconds, maximum seconds]
+        self.steps = {}
+
+    def add(self, name, step, elapsed):
+        timing = self.steps.get((name, step))
+        if timing is None:
+            self.steps[name, step] = [1, elapsed, elapsed]
         else:
-            raise AttributeError(
-                "Attribute '{0}' of class '{1}' is immutable."
-                .format(attr, self.__class__.__name__)
-            )
+            timing[0] += 1
+            timing[1] += elapsed
+            if elapsed > timing[2]:
+                timing[2] = elapsed
 
-    def wrap(cl):
-        cl.__original_setattr__ = cl.__setattr__
-        cl.__setattr__ = characteristic_immutability_sentry
-        return cl
 
-    return wrap
+_INIT_TRACES = weakref.WeakKeyDictionary()
 
 
-def _default_store_attributes(cls, attrs):
-    """
-    Store attributes in :attr:`characteristic_attributes` on the class.
+def init_trace_report(limit=None):
     """
-    cls.characteristic_attributes = attrs
+    Rank the steps of initializing attributes of all classes that are
+    decorated using :func:`with_init` with ``trace_init=True`` (or
+    :func:`attributes` with ``trace_init=True``) by the total time they took.
 
+    The steps of each attribute are:
 
-def attributes(attrs, apply_with_cmp=True, apply_with_init=True,
-               apply_with_repr=True, apply_immutable=False,
-               store_attributes=_default_store_attributes, **kw):
-    """
-    A convenience class decorator that allows to *selectively* apply
-    :func:`with_cmp`, :func:`with_repr`, :func:`with_init`, and
-    :func:`immutable` to avoid code duplication.
+    - ``"pop"``: taking the value from the keyword arguments,
+    - ``"default"``: using the default value if none has been passed,
+    - ``"factory"``: calling the default factory if none has been passed,
+    - ``"pool"``: acquiring a value from the default pool if none has been
+      passed,
+    - ``"isinstance"``: checking the value against ``instance_of``.
 
-    :param attrs: Attributes to work with.
-    :type attrs: ``list`` of :class:`str` or :class:`Attribute`\ s.
+    :param limit: Only return the *limit* costliest steps.
+    :type limit: int
 
-    :param apply_with_cmp: Apply :func:`with_cmp`.
-    :type apply_with_cmp: bool
+    :return: Tuples of the class, the attribute name, the step, how often it
+        ran, the total time, and the maximum time in seconds.  Costliest
+        first.
+    :rtype: list
 
-    :param apply_with_init: Apply :func:`with_init`.
-    :type apply_with_init: bool
+    .. versionadded:: 15.0
+    """
+    rv = [
+        (cl, name, step, calls, total, maximum)
+        for cl, trace in list(_INIT_TRACES.items())
+        for (name, step), (calls, total, maximum) in trace.steps.items()
+    ]
+    rv.sort(key=lambda entry: entry[4], reverse=True)
+    return rv[:limit]
 
-    :param apply_with_repr: Apply :func:`with_repr`.
-    :type apply_with_repr: bool
 
-    :param apply_immutable: Apply :func:`immutable`.  The only one that is off
-        by default.
-    :type apply_immutable: bool
+# Compiled generated code is shared by classes with identical scripts.  The
+# cache is bounded because dynamically created classes with distinct layouts
+# would make it grow forever.
+_CODE_CACHE = {}
+_CODE_CACHE_SIZE = 512
 
-    :param store_attributes: Store the given ``attr``\ s on the class.
-        Should accept two arguments, the class and the attributes, in that
-        order. Note that attributes passed in will always be instances of
-        :class:`Attribute`\ , (so simple string attributes will already have
-        been converted). By default if unprovided, attributes are stored in
-        a ``characteristic_attributes`` attribute on the class.
-    :type store_attributes: callable
 
-    :raises ValueError: If both *defaults* and an instance of
-        :class:`Attribute` has been passed.
+def _compile_cached(script, filename):
+    """
+    Compile *script* into a code object using *filename* unless an identical
+    script has been compiled recently.
+
+    Classes with the same attribute layout share the generated script, so
+    there is no need to pay for :func:`compile` more than once per layout.
+    The cache is keyed by the script alone because file names may depend on
+    default values that don't affect the script, so the returned code
+    object may carry the file name of an earlier compilation.
+    """
+    try:
+        return _CODE_CACHE[script]
+    except KeyError:
+        if len(_CODE_CACHE) >= _CODE_CACHE_SIZE:
+            _CODE_CACHE.clear()
+        bytecode = _CODE_CACHE[script] = compile(script, filename, "exec")
+        return bytecode
 
-    .. versionadded:: 14.0
-        Added possibility to pass instances of :class:`Attribute` in ``attrs``.
 
-    .. versionadded:: 14.0
-        Added ``apply_*``.
+# Code objects of generated functions that have been compiled ahead of time by
+# importing modules written by emit_module(), keyed by _script_key().
+_PRECOMPILED = {}
 
-    .. versionadded:: 14.2
-        Added ``store_attributes``.
+# The scripts passed to _make_function() while emit_module() imports modules.
+_RECORDED = None
 
-    .. deprecated:: 14.0
-        Use :class:`Attribute` instead of ``defaults``.
 
-    :param defaults: Default values if attributes are omitted on instantiation.
-    :type defaults: ``dict`` or ``None``
+def _script_key(script):
+    """
+    Return the key of the generated *script* in ``_PRECOMPILED``.
+    """
+    return hashlib.sha1(script.encode("utf-8")).hexdigest()
 
-    .. deprecated:: 14.0
-        Use ``apply_with_init`` instead of ``create_init``.  Until removal, if
-        *either* if `False`, ``with_init`` is not applied.
 
-    :param create_init: Apply :func:`with_init`.
-    :type create_init: bool
+def register_code(code):
     """
+    Register code objects of generated functions that have been compiled
+    ahead of time.  Modules written by :func:`emit_module` call it when they
+    are imported, there is no need to call it yourself.
 
-    create_init = kw.pop("create_init", None)
-    if create_init is not None:
-        apply_with_init = create_init
-        warnings.warn(
-            "`create_init` has been deprecated in 14.0, please use "
-            "`apply_with_init`.", DeprecationWarning,
-            stacklevel=2,
-        )
-    attrs = _ensure_attributes(attrs, defaults=kw.pop("defaults", NOTHING))
+    :param code: Maps keys of generated scripts to the code objects of the
+        functions that they define.
+    :type code: dict
 
-    if kw:
-        raise TypeError(
-            "attributes() got an unexpected keyword argument {0!r}".format(
-                next(iter(kw)),
-            )
-        )
+    .. versionadded:: 15.0
+    """
+    _PRECOMPILED.update(code)
 
-    def wrap(cl):
-        store_attributes(cl, attrs)
+
+def emit_module(module_names, f):
+    """
+    Import the modules called *module_names* -- or reload them if they have
+    been imported already -- and write a plain Python module to *f* that
+    contains the source of all methods that :mod:`characteristic` generated
+    for their classes.
+
+    If the written module is imported before the modules that it has been
+    generated for, decorating their classes takes the compiled methods from
+    it instead of compiling the generated code.  Like every module, it's
+    cached as ``.pyc``, so processes start faster.  Methods whose code has
+    changed since (e.g. because the attributes of a class changed) are
+    generated as usual, so a stale module is slower but never wrong.
+
+    Run it in a separate process because reloading re-creates all classes of
+    the modules::
+
+        $ python -c "import sys, characteristic; \\
+              characteristic.emit_module(['app.models'], sys.stdout)" \\
+              > app/_precompiled.py
+
+    :param module_names: Names of the modules to import.
+    :type module_names: ``list`` of :class:`str`
+
+    :param f: A text file to write the module to.
+
+    :return: The number of generated functions written.
+    :rtype: int
+
+    .. versionadded:: 15.0
+    """
+    global _RECORDED
+
+    try:
+        from importlib import reload
+    except ImportError:  # pragma: nocover
+        try:
+            from imp import reload
+        except ImportError:
+            import __builtin__
+            reload = __builtin__.reload
+
+    _RECORDED = []
+    try:
+        for name in module_names:
+            if name in sys.modules:
+                reload(sys.modules[name])
+            else:
+                __import__(name)
+        scripts = _RECORDED
+    finally:
+        _RECORDED = None
+
+    seen = set()
+    f.write(
+        '"""\n'
+        "Methods generated ahead of time by characteristic for {0}.\n"
+        "\n"
+        "Written by characteristic.emit_module(), don't edit.\n"
+        '"""\n'
+        "\n"
+        "from characteristic import register_code\n"
+        "\n"
+        "\n"
+        "_code = {{}}\n".format(", ".join(module_names))
+    )
+    for script in scripts:
+        key = _script_key(script)
+        if key in seen:
+            continue
+        seen.add(key)
+        name = script[len("def "):script.index("(")]
+        f.write("\n\n{0}\n\n_code[{1!r}] = {2}.__code__\n".format(
+            script.rstrip("\n"), key, name,
+        ))
+    f.write("\n\nregister_code(_code)\n")
+    return len(seen)
+
+
+_VALID_INITS = frozenset(["characteristic_init", "__init__"])
+
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _is_parameter_name(name):
+    """
+    Check whether *name* can be used as the name of a parameter.
+    """
+    if hasattr(name, "isidentifier"):
+        valid = name.isidentifier()
+    else:
+        valid = _IDENTIFIER.match(name) is not None
+    return valid and not keyword.iskeyword(name)
+
+
+def _add_signature(func, attrs, globs, original=None):
+    """
+    Set ``__signature__`` and ``__annotations__`` of the generated *func* such
+    that introspection sees keyword-only arguments for *attrs* instead of
+    ``*args, **kw``.
+
+    Attributes with a ``default_factory`` or a ``default_pool`` get
+    :data:`NOTHING` as their default, those with ``instance_of`` get it as
+    their annotation.  The arguments of *original* -- which receives
+    everything that isn't consumed -- are kept if possible.  Does nothing on
+    Pythons without :class:`inspect.Signature` and if a keyword argument name
+    can't be a parameter name, like ``from`` for an attribute ``_from``.
+    """
+    if not HAS_SIGNATURE or not all(
+        _is_parameter_name(a._kw_name) for a in attrs
+    ):
+        return
+    Parameter = inspect.Parameter
+
+    own = []
+    annotations = {}
+    for i, a in enumerate(attrs):
+        if a.share_default is True:
+            default = globs["shared_{0}".format(i)]
+        elif a.default_factory is not None or a.default_pool is not None:
+            default = NOTHING
+        elif a.default_value is NOTHING:
+            default = Parameter.empty
+        else:
+            default = a.default_value
+        annotation = Parameter.empty
+        if a.instance_of is not None:
+            annotation = annotations[a._kw_name] = a.instance_of
+        own.append(Parameter(a._kw_name, Parameter.KEYWORD_ONLY,
+                             default=default, annotation=annotation))
+
+    first = Parameter(func.__code__.co_varnames[0],
+                      Parameter.POSITIONAL_OR_KEYWORD)
+    signature = inspect.Signature([first] + own)
+    if original is not None and original is not object.__init__:
+        try:
+            params = list(inspect.signature(original).parameters.values())[1:]
+            names = frozenset(p.name for p in own)
+            params = [p for p in params if p.name not in names]
+            signature = inspect.Signature(
+                [first]
+                + [p for p in params if p.kind < Parameter.KEYWORD_ONLY]
+                + own
+                + [p for p in params if p.kind >= Parameter.KEYWORD_ONLY]
+            )
+        except (TypeError, ValueError):
+            pass
+
+    func.__signature__ = signature
+    func.__annotations__ = annotations
+
+
+def _original(cl, name, generated_name):
+    """
+    Return the method *name* of *cl* that a generated method is going to
+    wrap.
+
+    If *cl* merely inherits a method called *generated_name* from a decorated
+    base class, the method that the base's one wraps is returned instead.
+    That keeps subclasses from calling (and possibly recursing into) the
+    generated methods of their bases.
+    """
+    method = getattr(cl, name)
+    if (
+        name in cl.__dict__
+        or getattr(method, "__name__", None) != generated_name
+    ):
+        return method
+    original_name = "__original_" + name[2:]
+    for base in getattr(cl, "__mro__", ())[1:]:
+        if original_name in base.__dict__:
+            return base.__dict__[original_name]
+    return method
+
+
+_INITIALIZING = {}
+
+
+def _immutable_without_frames(attrs):
+    """
+    Return a class decorator like :func:`immutable` for attribute names
+    *attrs* that doesn't inspect frames while instances are initialized.
+
+    Instead, ``__init__`` is wrapped to count the instances that are being
+    initialized by their ids in ``_INITIALIZING``.  Counting makes nested
+    calls like ``super().__init__()`` work.  Initializers that
+    :func:`with_init` creates later count the instances themselves.
+
+    Only attributes that are set while the instance isn't counted -- like
+    from the ``__init__`` of an undecorated subclass before it calls the one
+    of its base -- fall back to inspecting the frame of the caller.
+    """
+    initializing = _INITIALIZING
+
+    def characteristic_immutability_sentry(self, attr, value):
+        """
+        Immutability sentry automatically created by characteristic.
+
+        If an attribute is attempted to be set from any other place than an
+        initializer, an AttributeError is raised.  Else the original
+        __setattr__ is called.
+        """
+        if (
+            attr not in self.__class__.__characteristic_immutable__
+            or id(self) in initializing
+            or sys._getframe(1).f_code.co_name in _VALID_INITS
+        ):
+            self.__original_setattr__(attr, value)
+        else:
+            raise AttributeError(
+                "Attribute '{0}' of class '{1}' is immutable."
+                .format(attr, self.__class__.__name__)
+            )
+
+    def wrap(cl):
+        original_init = cl.__init__
+
+        def characteristic_immutable_init(self, *args, **kw):
+            """
+            Initializer wrapper automatically created by characteristic.
+            """
+            key = id(self)
+            initializing[key] = initializing.get(key, 0) + 1
+            try:
+                original_init(self, *args, **kw)
+            finally:
+                count = initializing.pop(key) - 1
+                if count:
+                    initializing[key] = count
+
+        if original_init is not object.__init__:
+            characteristic_immutable_init.__wrapped__ = original_init
+        cl.__original_setattr__ = _original(
+            cl, "__setattr__", "characteristic_immutability_sentry"
+        )
+        cl.__characteristic_immutable__ = _merge_immutable(cl, attrs)
+        cl.__setattr__ = characteristic_immutability_sentry
+        cl.__init__ = characteristic_immutable_init
+        return cl
+
+    return wrap
+
+
+def _merge_immutable(cl, attrs):
+    """
+    Return the attribute names *attrs* followed by the names that are
+    immutable in the bases of *cl*.
+
+    A re-decorated subclass doesn't call the immutability sentries of its
+    bases, so it has to check their attributes itself.
+    """
+    return attrs + tuple(
+        name for name in getattr(cl, "__characteristic_immutable__", ())
+        if name not in attrs
+    )
+
+
+def _is_frozen(cl):
+    """
+    Check whether *cl* has been decorated by :func:`immutable` on top of the
+    default ``__setattr__``, which allows initializers to bypass the
+    immutability sentry and set attributes directly.
+    """
+    return (
+        getattr(cl.__setattr__, "__name__", None)
+        == "characteristic_immutability_sentry"
+        and getattr(cl, "__original_setattr__", None) is object.__setattr__
+    )
+
+
+def immutable(attrs):
+    """
+    Class decorator that makes *attrs* of a class immutable.
+
+    That means that *attrs* can only be set from an initializer.  If anyone
+    else tries to set one of them, an :exc:`AttributeError` is raised.
+
+    Initializers created by :func:`with_init` *after* applying
+    :func:`immutable` (like :func:`attributes` does) set attributes directly
+    using :meth:`object.__setattr__` instead of going through the
+    immutability check, unless the class or a subclass defines its own
+    ``__setattr__``.
+
+    On PyPy, frames aren't inspected while the ``__init__`` of the class
+    runs for the instance because that disables the JIT.
+
+    .. versionadded:: 14.0
+    """
+    # In this case, we just want to compare (native) strings.
+    attrs = tuple(attr.name if isinstance(attr, Attribute) else attr
+                  for attr in _ensure_attributes(attrs, NOTHING)
+                  if attr.exclude_from_immutable is False)
+    if PYPY:
+        return _immutable_without_frames(attrs)
+
+    def wrap(cl):
+        cl.__original_setattr__ = _original(
+            cl, "__setattr__", "characteristic_immutability_sentry"
+        )
+        cl.__characteristic_immutable__ = _merge_immutable(cl, attrs)
+        cl.__setattr__ = characteristic_immutability_sentry
+        return cl
+
+    return wrap
+
+
+def characteristic_immutability_sentry(self, attr, value):
+    """
+    Immutability sentry shared by all classes decorated by :func:`immutable`.
+
+    If an attribute is attempted to be set from any other place than an
+    initializer, a TypeError is raised.  Else the original __setattr__ is
+    called.
+    """
+    prev = sys._getframe().f_back
+    if (
+        attr not in self.__class__.__characteristic_immutable__
+        or
+        prev is not None and prev.f_code.co_name in _VALID_INITS
+    ):
+        self.__original_setattr__(attr, value)
+    else:
+        raise AttributeError(
+            "Attribute '{0}' of class '{1}' is immutable."
+            .format(attr, self.__class__.__name__)
+        )
+
+
+def _default_store_attributes(cls, attrs):
+    """
+    Store attributes in :attr:`characteristic_attributes` on the class.
+    """
+    cls.characteristic_attributes = attrs
+
+
+def _add_slots(cl, attrs, weakref_slot):
+    """
+    Return a new class with the same name, bases, and members as *cl* that
+    stores *attrs* in ``__slots__`` instead of an instance dictionary.
+
+    Attributes that are already stored in slots of a base class don't get
+    another one.
+    """
+    cl_dict = dict(cl.__dict__)
+    cl_dict.pop("__dict__", None)
+    cl_dict.pop("__weakref__", None)
+    slots = [a.name for a in attrs
+             if not any(isinstance(base.__dict__.get(a.name),
+                                   types.MemberDescriptorType)
+                        for base in cl.__mro__[1:])]
+    if weakref_slot is True and not any(
+        "__weakref__" in getattr(base, "__dict__", ())
+        for base in cl.__mro__[1:]
+    ):
+        slots.append("__weakref__")
+    cl_dict["__slots__"] = tuple(slots)
+    if "__getstate__" not in cl_dict and "__setstate__" not in cl_dict:
+        cl_dict["__characteristic_slots__"] = tuple(a.name for a in attrs)
+        cl_dict["__getstate__"] = _getstate_slots
+        cl_dict["__setstate__"] = _setstate_slots
+    qualname = getattr(cl, "__qualname__", None)
+    if qualname is not None:
+        cl_dict["__qualname__"] = qualname
+    return _update_class_cells(
+        cl, type(cl)(cl.__name__, cl.__bases__, cl_dict)
+    )
+
+
+def _getstate_slots(self):
+    """
+    Return the instance dictionary (if any) and the values of the slotted
+    attributes that have been set for pickling and copying.
+    """
+    values = {}
+    for name in self.__class__.__characteristic_slots__:
+        try:
+            values[name] = getattr(self, name)
+        except AttributeError:
+            pass
+    return getattr(self, "__dict__", None), values
+
+
+def _setstate_slots(self, state):
+    """
+    Restore the *state* that :func:`_getstate_slots` returned.
+
+    The values are set using :meth:`object.__setattr__` because
+    immutability sentries would reject them.
+    """
+    instance_dict, values = state
+    if instance_dict:
+        self.__dict__.update(instance_dict)
+    for name, value in values.items():
+        object.__setattr__(self, name, value)
+
+
+def _update_class_cells(old, new):
+    """
+    Make the methods of the class *new* that has been created from the
+    members of *old* refer to *new* in their closures and return it.
+
+    That's what makes zero-argument ``super()`` -- which uses the implicit
+    ``__class__`` cell -- work in replaced classes.  Closure cells can only
+    be updated on Python 3.7 and later, so it keeps failing before.
+    """
+    for value in new.__dict__.values():
+        if isinstance(value, property):
+            funcs = [value.fget, value.fset, value.fdel]
+        else:
+            funcs = [getattr(value, "__func__", value)]
+        for func in funcs:
+            for cell in getattr(func, "__closure__", None) or ():
+                try:
+                    if cell.cell_contents is not old:
+                        continue
+                except ValueError:  # empty cell
+                    continue
+                try:
+                    cell.cell_contents = new
+                except (AttributeError, TypeError):  # read-only before 3.7
+                    return new
+    return new
+
+
+def _tuple_from_values(cl, values):
+    """
+    Recreate an instance of the ``tuple`` based class *cl* from *values*.
+
+    Used for pickling and copying.
+    """
+    return tuple.__new__(cl, values)
+
+
+def _reduce_tuple(self):
+    """
+    Pickle instances of ``tuple`` based classes without calling their
+    keyword-only ``__new__``.
+    """
+    return _tuple_from_values, (self.__class__, tuple(self))
+
+
+def _make_tuple_class(cl, attrs):
+    """
+    Return a new class with the same name and members as *cl* that is a
+    ``tuple`` of the values of *attrs* with read-only properties to access
+    them.
+
+    :raises ValueError: If *cl* defines or inherits an ``__init__`` or an
+        attribute is excluded from the initializer.
+    """
+    if "__init__" in cl.__dict__:
+        raise ValueError(
+            "Classes with tuple storage can't have an __init__."
+        )
+    if cl.__init__ is not object.__init__:
+        # E.g. the generated initializer of a base decorated by attributes()
+        # which would try to set the read-only properties.
+        raise ValueError(
+            "Classes with tuple storage can't inherit an __init__."
+        )
+    for a in attrs:
+        if a.exclude_from_init is True:
+            raise ValueError(
+                "Attribute {0!r} can't be excluded from the initializer of a "
+                "class with tuple storage.".format(a.name)
+            )
+
+    cl_dict = dict(cl.__dict__)
+    cl_dict.pop("__dict__", None)
+    cl_dict.pop("__weakref__", None)
+    cl_dict["__slots__"] = ()
+    for i, a in enumerate(attrs):
+        cl_dict[a.name] = property(itemgetter(i))
+
+    globs = {"NOTHING": NOTHING, "attrs": attrs, "new": tuple.__new__}
+    for i, a in enumerate(attrs):
+        if a.share_default is True:
+            globs["shared_{0}".format(i)] = a.default_factory()
+    cl_dict["__new__"] = _make_function(
+        "characteristic_new", _attrs_to_new_script(attrs),
+        _unique_filename("new", attrs), globs,
+    )
+    _add_signature(cl_dict["__new__"], attrs, globs)
+    cl_dict["__reduce__"] = _reduce_tuple
+    qualname = getattr(cl, "__qualname__", None)
+    if qualname is not None:
+        cl_dict["__qualname__"] = qualname
+
+    bases = tuple(b for b in cl.__bases__ if b is not object)
+    if not any(issubclass(b, tuple) for b in bases):
+        bases += (tuple,)
+    return _update_class_cells(cl, type(cl)(cl.__name__, bases, cl_dict))
+
+
+_STORAGES = frozenset(["dict", "slots", "sparse", "tuple"])
+
+
+def attributes(attrs, apply_with_cmp=True, apply_with_init=True,
+               apply_with_repr=True, apply_immutable=False,
+               store_attributes=_default_store_attributes, storage="dict",
+               weakref_slot=True, track_instances=False,
+               inherit_attributes=False, trace_init=False, eq=True,
+               order=True, hash=True, **kw):
+    """
+    A convenience class decorator that allows to *selectively* apply
+    :func:`with_cmp`, :func:`with_repr`, :func:`with_init`, and
+    :func:`immutable` to avoid code duplication.
+
+    :param attrs: Attributes to work with.
+    :type attrs: ``list`` of :class:`str` or :class:`Attribute`\ s.
+
+    :param apply_with_cmp: Apply :func:`with_cmp`.
+    :type apply_with_cmp: bool
+
+    :param eq: Passed to :func:`with_cmp`.
+    :type eq: bool
+
+    :param order: Passed to :func:`with_cmp`.
+    :type order: bool
+
+    :param hash: Passed to :func:`with_cmp`.
+    :type hash: bool
+
+    :param apply_with_init: Apply :func:`with_init`.
+    :type apply_with_init: bool
+
+    :param apply_with_repr: Apply :func:`with_repr`.
+    :type apply_with_repr: bool
+
+    :param apply_immutable: Apply :func:`immutable`.  The only one that is off
+        by default.
+    :type apply_immutable: bool
+
+    :param store_attributes: Store the given ``attr``\ s on the class.
+        Should accept two arguments, the class and the attributes, in that
+        order. Note that attributes passed in will always be instances of
+        :class:`Attribute`\ , (so simple string attributes will already have
+        been converted). By default if unprovided, attributes are stored in
+        a ``characteristic_attributes`` attribute on the class.
+    :type store_attributes: callable
+
+    :param storage: How instances store the values of *attrs*.  ``"dict"``
+        keeps them in the usual instance dictionary.  ``"sparse"`` does the
+        same but leaves out values that are identical to the default value of
+        their attribute and stores the defaults on the class instead (see the
+        *sparse* argument of :func:`with_init`).  ``"slots"`` replaces the
+        class by an otherwise identical one that stores them in
+        ``__slots__`` which makes instances considerably smaller.  Note that
+        instances of slotted classes can't have any other attributes unless a
+        base class has an instance dictionary.  ``"tuple"`` replaces the class
+        by a ``tuple`` subclass of the values of *attrs* with read-only
+        properties.  Those instances are the smallest and immutable, and they
+        compare and hash like (and equal to) plain tuples of their values.
+        Their class can't have an ``__init__``, attributes can't be excluded
+        from the initializer, and ``apply_with_init`` and ``apply_immutable``
+        are ignored.  Zero-argument ``super()`` in methods of classes that
+        are replaced by ``"slots"`` or ``"tuple"`` needs Python 3.7 or later.
+    :type storage: str
+
+    :param weakref_slot: Whether instances of classes with ``"slots"``
+        storage can be weakly referenced.  Costs one pointer per instance.
+    :type weakref_slot: bool
+
+    :param track_instances: Passed to :func:`with_init`.
+    :type track_instances: bool
+
+    :param trace_init: Passed to :func:`with_init`.
+    :type trace_init: bool
+
+    :param inherit_attributes: Prepend the attributes of the closest base
+        class that has been decorated by :func:`attributes` to *attrs*.
+        Attributes in *attrs* replace inherited ones of the same name.  The
+        subclass gets a single initializer for all attributes, so
+        instantiating it costs the same regardless of the depth of the
+        hierarchy.
+    :type inherit_attributes: bool
+
+    :raises ValueError: If both *defaults* and an instance of
+        :class:`Attribute` has been passed.
+    :raises ValueError: If *storage* is unknown.
+    :raises ValueError: If *storage* is ``"tuple"`` and the class has or
+        inherits an ``__init__``.
+    :raises ValueError: If *storage* is ``"sparse"`` and a default would
+        replace an attribute of the class.
+    :raises ValueError: If *storage* is ``"tuple"`` and *track_instances* or
+        *trace_init* is `True`.
+    :raises ValueError: If *storage* is ``"slots"``, *track_instances* is
+        `True`, and neither *weakref_slot* nor a base class makes instances
+        weakly referenceable.
+    :raises ValueError: If *storage* is ``"tuple"`` and *eq*, *order*, or
+        *hash* is `False`.
+
+    .. versionadded:: 14.0
+        Added possibility to pass instances of :class:`Attribute` in ``attrs``.
+
+    .. versionadded:: 14.0
+        Added ``apply_*``.
+
+    .. versionadded:: 14.2
+        Added ``store_attributes``.
+
+    .. versionadded:: 15.0
+        Added ``storage``, ``weakref_slot``, ``track_instances``,
+        ``inherit_attributes``, ``trace_init``, ``eq``, ``order``, and
+        ``hash``.
+
+    .. deprecated:: 14.0
+        Use :class:`Attribute` instead of ``defaults``.
+
+    :param defaults: Default values if attributes are omitted on instantiation.
+    :type defaults: ``dict`` or ``None``
+
+    .. deprecated:: 14.0
+        Use ``apply_with_init`` instead of ``create_init``.  Until removal, if
+        *either* if `False`, ``with_init`` is not applied.
+
+    :param create_init: Apply :func:`with_init`.
+    :type create_init: bool
+    """
+
+    create_init = kw.pop("create_init", None)
+    if create_init is not None:
+        apply_with_init = create_init
+        warnings.warn(
+            "`create_init` has been deprecated in 14.0, please use "
+            "`apply_with_init`.", DeprecationWarning,
+            stacklevel=2,
+        )
+    attrs = _ensure_attributes(attrs, defaults=kw.pop("defaults", NOTHING))
+
+    if kw:
+        raise TypeError(
+            "attributes() got an unexpected keyword argument {0!r}".format(
+                next(iter(kw)),
+            )
+        )
+    if storage not in _STORAGES:
+        raise ValueError("Unknown storage {0!r}.".format(storage))
+    if storage == "tuple" and (
+        track_instances is True or trace_init is True
+    ):
+        raise ValueError(
+            "Instances of classes with tuple storage can't be tracked or "
+            "traced."
+        )
+    if storage == "tuple" and not (
+        eq is True and order is True and hash is True
+    ):
+        raise ValueError(
+            "Instances of classes with tuple storage always compare, order, "
+            "and hash like tuples."
+        )
+
+    def wrap(cl):
+        cl_attrs = attrs
+        if inherit_attributes is True:
+            cl_attrs = _inherit_attributes(cl, attrs)
+        if storage == "slots":
+            if (
+                track_instances is True and weakref_slot is False
+                and not any("__weakref__" in getattr(base, "__dict__", ())
+                            for base in cl.__mro__[1:])
+            ):
+                raise ValueError(
+                    "Instances of classes with slots storage can't be "
+                    "tracked without a weakref slot."
+                )
+            cl = _add_slots(cl, cl_attrs, weakref_slot)
+        elif storage == "tuple":
+            cl = _make_tuple_class(cl, cl_attrs)
+        store_attributes(cl, cl_attrs)
+        _SCHEMAS[cl] = Schema(cl_attrs)
 
         if apply_with_repr is True:
-            cl = with_repr(attrs)(cl)
+            cl = with_repr(cl_attrs)(cl)
+        if storage == "tuple":
+            # Tuples compare and hash natively and are immutable anyway.
+            # Only excluded attributes need the generated methods.
+            if apply_with_cmp is True and any(
+                a.exclude_from_cmp is True for a in cl_attrs
+            ):
+                cl = with_cmp(cl_attrs)(cl)
+            return cl
         if apply_with_cmp is True:
-            cl = with_cmp(attrs)(cl)
+            cl = with_cmp(cl_attrs, eq=eq, order=order, hash=hash)(cl)
         if apply_immutable is True:
-            cl = immutable(attrs)(cl)
+            cl = immutable(cl_attrs)(cl)
         if apply_with_init is True:
-            cl = with_init(attrs)(cl)
+            cl = with_init(cl_attrs, track_instances=track_instances,
+                           trace_init=trace_init,
+                           sparse=storage == "sparse")(cl)
         return cl
     return wrap
 
 
-def _attrs_to_script(attrs):
+def _inherit_attributes(cl, attrs):
+    """
+    Return the attributes of the closest decorated base class of *cl* that
+    aren't overridden by *attrs*, followed by *attrs*.
+    """
+    for base in cl.__mro__[1:]:
+        parent = _find_schema(base)
+        if parent is not None:
+            break
+    else:
+        return attrs
+    names = frozenset(a.name for a in attrs)
+    return [a for a in parent.attributes if a.name not in names] + attrs
+
+
+class Schema(object):
+    """
+    Precomputed lookup tables for the attributes of a class decorated by
+    :func:`attributes`.  Use :func:`schema` to get the one of a class.
+
+    .. attribute:: attributes
+
+       A ``tuple`` of all :class:`Attribute`\ s of the class.
+
+    .. attribute:: init_attributes
+
+       A ``tuple`` of the :class:`Attribute`\ s that are initialized by
+       :func:`with_init`.
+
+    .. attribute:: cmp_attributes
+
+       A ``tuple`` of the :class:`Attribute`\ s that are compared by
+       :func:`with_cmp`.
+
+    .. attribute:: by_name
+
+       A ``dict`` that maps attribute names to :class:`Attribute`\ s.
+
+    .. attribute:: by_kw_name
+
+       A ``dict`` that maps initializer keyword argument names to
+       :class:`Attribute`\ s.
+
+    .. attribute:: defaults
+
+       A ``dict`` that maps initializer keyword argument names to the
+       ``default_value`` of all attributes that have one.
+
+    .. attribute:: factory_positions
+
+       A ``tuple`` of the indexes of the attributes in :attr:`attributes`
+       that have a ``default_factory``.
+
+    .. attribute:: instance_of_positions
+
+       A ``tuple`` of the indexes of the attributes in :attr:`attributes`
+       that are initialized by :func:`with_init` and have an
+       ``instance_of``.
+
+    .. versionadded:: 15.0
+    """
+    __slots__ = [
+        "attributes", "init_attributes", "cmp_attributes", "by_name",
+        "by_kw_name", "defaults", "factory_positions",
+        "instance_of_positions", "_differ", "_deep_eq",
+    ]
+
+    def __init__(self, attrs):
+        self.attributes = tuple(attrs)
+        self.init_attributes = tuple(
+            a for a in attrs if a.exclude_from_init is False
+        )
+        # Used for diffing and deep comparisons.
+        self.cmp_attributes = tuple(
+            a for a in attrs if a.exclude_from_cmp is False
+        )
+        self.by_name = dict((a.name, a) for a in attrs)
+        self.by_kw_name = dict((a._kw_name, a) for a in self.init_attributes)
+        self.defaults = dict((a._kw_name, a.default_value)
+                             for a in self.init_attributes
+                             if a.default_value is not NOTHING)
+        self.factory_positions = tuple(
+            i for i, a in enumerate(attrs) if a.default_factory is not None
+        )
+        self.instance_of_positions = tuple(
+            i for i, a in enumerate(attrs)
+            if a.instance_of is not None and a.exclude_from_init is False
+        )
+        # Generated on first use by diff() and deep_eq().
+        self._differ = None
+        self._deep_eq = None
+
+    def __repr__(self):
+        return "<Schema({0})>".format(
+            ", ".join(a.name for a in self.attributes)
+        )
+
+
+_SCHEMAS = weakref.WeakKeyDictionary()
+
+
+def _find_schema(cl):
+    """
+    Return the :class:`Schema` of *cl* or `None` if *cl* hasn't been
+    decorated by :func:`attributes`.
+
+    Subclasses of decorated classes share the schema of their closest
+    decorated base.  Classes that only have ``characteristic_attributes`` get
+    a schema built from them.  Misses are cached too because :func:`diff` and
+    :func:`deep_eq` look up the class of every value they come across.
+    """
+    try:
+        return _SCHEMAS[cl]
+    except KeyError:
+        pass
+    for base in getattr(cl, "__mro__", ())[1:]:
+        rv = _SCHEMAS.get(base)
+        if rv is not None:
+            break
+    else:
+        attrs = getattr(cl, "characteristic_attributes", None)
+        rv = None if attrs is None else Schema(attrs)
+    _SCHEMAS[cl] = rv
+    return rv
+
+
+def schema(cl):
+    """
+    Return the :class:`Schema` of *cl*.
+
+    Classes are registered by :func:`attributes` independently of
+    ``store_attributes``.  The registry references them weakly, so it doesn't
+    keep classes alive.
+
+    :param cl: A class decorated by :func:`attributes`.
+    :type cl: type
+
+    :rtype: :class:`Schema`
+
+    :raises TypeError: If *cl* hasn't been decorated by :func:`attributes`.
+
+    .. versionadded:: 15.0
+    """
+    rv = _find_schema(cl)
+    if rv is None:
+        raise TypeError(
+            "'{0}' is not a class decorated by attributes().".format(
+                cl.__name__
+            )
+        )
+    return rv
+
+
+def _get_attributes(cl):
+    """
+    Return the attributes that :func:`attributes` registered for *cl*.
+
+    :raises TypeError: If *cl* hasn't been decorated by :func:`attributes`.
+    """
+    return schema(cl).attributes
+
+
+def diff(a, b):
+    """
+    Return the differences between the attributes of *a* and *b* which must
+    be instances of the same class decorated by :func:`attributes`.
+
+    Attributes whose values are instances of the same class decorated by
+    :func:`attributes` are compared recursively, as are lists and tuples of
+    the same length.  Attributes that have been excluded from
+    :func:`with_cmp` are ignored.
+
+    :param a: The old instance.
+    :param b: The new instance.
+
+    :return: A dictionary that maps the paths of all changed attributes to
+        tuples of their old and new value.  Paths of nested attributes are
+        joined by a dot (``"address.street"``), items of sequences are
+        addressed by their index (``"tags[2]"``).
+    :rtype: dict
+
+    :raises TypeError: If *a* and *b* are instances of different classes or
+        their class hasn't been decorated by :func:`attributes`.
+
+    .. versionadded:: 15.0
+    """
+    if a.__class__ is not b.__class__:
+        raise TypeError(
+            "Can't diff instances of different classes '{0}' and '{1}'."
+            .format(a.__class__.__name__, b.__class__.__name__)
+        )
+    rv = {}
+    _diff_instances(rv, "", a, b)
+    return rv
+
+
+def _diff_instances(rv, prefix, a, b):
+    """
+    Add the differences between the attributes of *a* and *b* to *rv*.
+    """
+    s = schema(a.__class__)
+    differ = s._differ
+    if differ is None:
+        differ = s._differ = _make_differ(s.cmp_attributes)
+    differ(rv, prefix, a, b)
+
+
+_DIFFERS = {}
+
+# Types whose instances diff() and deep_eq() compare using ``==`` right away
+# without looking for a schema.  The last two are ``long`` and ``unicode`` on
+# Python 2.
+_SCALARS = frozenset([
+    type(None), bool, int, float, complex, bytes, str, type(1 << 64),
+    type(b"".decode("ascii")),
+])
+
+
+def _make_differ(attrs):
+    """
+    Return a function that adds the differences between the values of
+    *attrs* of two objects to a dictionary.
+
+    Like :func:`_make_cmp_values`, it is shared by all classes with the same
+    attribute names.
+    """
+    names = tuple(a.name for a in attrs)
+    try:
+        return _DIFFERS[names]
+    except KeyError:
+        differ = _DIFFERS[names] = _make_function(
+            "differ", _attrs_to_differ_script(names),
+            _unique_filename("diff", attrs),
+            {"diff_values": _diff_values, "scalars": _SCALARS},
+        )
+        return differ
+
+
+def _attrs_to_differ_script(names):
+    """
+    Return a valid Python script of a function that adds the differences
+    between the attributes *names* of two objects to a dictionary.
+    """
+    lines = []
+    for name in names:
+        lines.extend([
+            "    old = a.{0}".format(name),
+            "    new = b.{0}".format(name),
+            "    if old is not new:",
+            "        if (old.__class__ in scalars and",
+            "                old.__class__ is new.__class__):",
+            "            if old != new:",
+            "                rv[prefix + {0!r}] = (old, new)".format(name),
+            "        else:",
+            "            diff_values(rv, prefix + {0!r}, old, new)"
+            .format(name),
+        ])
+    return """\
+def differ(rv, prefix, a, b):
+    '''
+    Add the differences between the attributes of *a* and *b* to *rv*.
+
+    Automatically created by characteristic.
+    '''
+{lines}
+""".format(lines="\n".join(lines) or "    pass")
+
+
+def _diff_values(rv, path, old, new):
+    """
+    Add the differences between *old* and *new* to *rv*, recursing into
+    instances of decorated classes and sequences if possible.
+    """
+    if old.__class__ is new.__class__:
+        if _find_schema(old.__class__) is not None:
+            _diff_instances(rv, path + ".", old, new)
+            return
+        if isinstance(old, (list, tuple)) and len(old) == len(new):
+            for i, (o, n) in enumerate(zip(old, new)):
+                if o is not n:
+                    _diff_values(rv, "{0}[{1}]".format(path, i), o, n)
+            return
+    if old != new:
+        rv[path] = (old, new)
+
+
+def deep_eq(a, b):
+    """
+    Compare *a* and *b* structurally, even if they are part of a cyclic graph.
+
+    Instances of classes decorated by :func:`attributes` are compared
+    attribute by attribute (ignoring those that have been excluded from
+    :func:`with_cmp`), lists and tuples item by item, and dictionaries value
+    by value.  Everything else is compared using ``==``.  Identical objects
+    are equal without looking at them.  Pairs that are already being compared
+    further up in the graph are assumed to be equal, which makes cycles
+    terminate, and shared subgraphs are compared only once.
+
+    :rtype: bool
+
+    .. versionadded:: 15.0
+    """
+    return _deep_eq(a, b, set())
+
+
+def _deep_eq(a, b, seen):
+    """
+    Compare *a* and *b* structurally while tracking the pairs of containers
+    that are being compared in *seen*.
+    """
+    if a is b:
+        return True
+    cl = a.__class__
+    s = _find_schema(cl)
+    if cl is not b.__class__:
+        if s is not None:
+            return False
+        return a == b
+
+    if s is not None:
+        key = (id(a), id(b))
+        if key in seen:
+            return True
+        seen.add(key)
+        eq = s._deep_eq
+        if eq is None:
+            eq = s._deep_eq = _make_deep_eq(s.cmp_attributes)
+        return eq(a, b, seen)
+    elif isinstance(a, (list, tuple)):
+        if len(a) != len(b):
+            return False
+        pairs = zip(a, b)
+    elif isinstance(a, dict):
+        if len(a) != len(b):
+            return False
+        try:
+            pairs = [(value, b[key]) for key, value in a.items()]
+        except KeyError:
+            return False
+    else:
+        return a == b
+
+    # Since the first difference ends the whole comparison, every pair in
+    # *seen* is either still being compared or known to be equal.
+    key = (id(a), id(b))
+    if key in seen:
+        return True
+    seen.add(key)
+    for x, y in pairs:
+        if not _deep_eq(x, y, seen):
+            return False
+    return True
+
+
+_DEEP_EQS = {}
+
+
+def _make_deep_eq(attrs):
+    """
+    Return a function that compares the values of *attrs* of two objects
+    using :func:`_deep_eq`.
+
+    Like :func:`_make_cmp_values`, it is shared by all classes with the same
+    attribute names.
+    """
+    names = tuple(a.name for a in attrs)
+    try:
+        return _DEEP_EQS[names]
+    except KeyError:
+        eq = _DEEP_EQS[names] = _make_function(
+            "deep_eq", _attrs_to_deep_eq_script(names),
+            _unique_filename("deep eq", attrs),
+            {"_deep_eq": _deep_eq, "scalars": _SCALARS},
+        )
+        return eq
+
+
+def _attrs_to_deep_eq_script(names):
+    """
+    Return a valid Python script of a function that compares the attributes
+    *names* of two objects using :func:`_deep_eq`.
+    """
+    lines = []
+    for name in names:
+        lines.extend([
+            "    x = a.{0}".format(name),
+            "    y = b.{0}".format(name),
+            "    if x is not y:",
+            "        if (x.__class__ in scalars and",
+            "                x.__class__ is y.__class__):",
+            "            if x != y:",
+            "                return False",
+            "        elif not _deep_eq(x, y, seen):",
+            "            return False",
+        ])
+    return """\
+def deep_eq(a, b, seen):
+    '''
+    Compare the attributes of *a* and *b* structurally.
+
+    Automatically created by characteristic.
+    '''
+{lines}
+    return True
+""".format(lines="\n".join(lines))
+
+
+def validate_columns(cl, columns):
+    """
+    Check whole columns of values against the ``instance_of`` of the
+    attributes of *cl* without instantiating it.
+
+    This allows for rejecting bad batches of records cheaply before paying
+    for creating any objects.
+
+    :param cl: A class decorated by :func:`attributes`.
+    :type cl: type
+
+    :param columns: A mapping of initializer keyword argument names to
+        sequences of values.  Columns of attributes without ``instance_of``
+        and columns that aren't passed are ignored.
+    :type columns: dict
+
+    :return: The row indexes and attribute names of all values that
+        :func:`with_init` would reject, ordered by row index first and the
+        order of the attributes second.
+    :rtype: ``list`` of ``(int, str)`` tuples
+
+    :raises TypeError: If *cl* hasn't been decorated by :func:`attributes`.
+
+    .. versionadded:: 15.0
+    """
+    s = schema(cl)
+    failures = []
+    for pos in s.instance_of_positions:
+        a = s.attributes[pos]
+        column = columns.get(a._kw_name)
+        if column is None:
+            continue
+        checks = list(map(isinstance, column, repeat(a.instance_of)))
+        if all(checks):
+            continue
+        failures.extend(
+            (i, pos, a.name) for i, ok in enumerate(checks) if not ok
+        )
+
+    failures.sort()
+    return [(i, name) for i, _, name in failures]
+
+
+def _init_attributes(cl):
+    """
+    Return the attributes of *cl* that are initialized by :func:`with_init`.
+    """
+    return schema(cl).init_attributes
+
+
+def _attrs_to_from_row_script(attrs):
+    """
+    Return a valid Python script of a function that instantiates ``cl`` from
+    the values of *attrs* passed as positional arguments.
+
+    Keyword argument names that can't be written as such, like ``from``, are
+    passed using a dictionary.
+    """
+    kws = []
+    others = []
+    for i, a in enumerate(attrs):
+        if _is_parameter_name(a._kw_name):
+            kws.append("{0}=v{1}".format(a._kw_name, i))
+        else:
+            others.append("{0!r}: v{1}".format(a._kw_name, i))
+    if others:
+        kws.append("**{{{0}}}".format(", ".join(others)))
+    return """\
+def from_row({args}):
+    '''
+    Automatically created by characteristic.
+    '''
+    return cl({kws})
+""".format(
+        args=", ".join("v{0}".format(i) for i in range(len(attrs))),
+        kws=", ".join(kws),
+    )
+
+
+def pack(cl, objs):
+    """
+    Pack *objs* into a compact and picklable representation.
+
+    Pickling a list of instances stores the class and the names of all
+    attributes again for every single instance.  The packed representation
+    stores the class and the initializer keyword argument names once and
+    the values of each instance positionally in a tuple.  That makes it a lot
+    smaller and faster to ship to other processes (e.g. using
+    :mod:`multiprocessing` or :mod:`concurrent.futures`).
+
+    Only attributes that are initialized by :func:`with_init` are packed.
+
+    :param cl: A class decorated by :func:`attributes`.
+    :type cl: type
+
+    :param objs: Instances of *cl*.
+    :type objs: iterable
+
+    :return: An opaque but picklable value to be passed to :func:`unpack`.
+
+    :raises TypeError: If *cl* hasn't been decorated by :func:`attributes`.
+
+    .. versionadded:: 15.0
+    """
+    attrs = _init_attributes(cl)
+    return (cl, tuple(a._kw_name for a in attrs),
+            list(map(_make_attrs_to_tuple(attrs), objs)))
+
+
+def unpack(packed):
+    """
+    Create a list of instances from the return value of :func:`pack`.
+
+    The instances are created using the class' initializer with keyword
+    arguments.
+
+    :raises ValueError: If the keyword argument names of the class have
+        changed since packing.
+
+    .. versionadded:: 15.0
+    """
+    cl, kw_names, rows = packed
+    attrs = _init_attributes(cl)
+    if tuple(a._kw_name for a in attrs) != kw_names:
+        raise ValueError(
+            "Packed attributes {0!r} don't match the attributes of '{1}'."
+            .format(kw_names, cl.__name__)
+        )
+    return list(starmap(_make_from_row(cl, attrs), rows))
+
+
+def evolve_many(objs, **changes):
+    """
+    Return copies of *objs* with the attributes that are passed as keyword
+    arguments changed to the passed values.
+
+    The keyword argument names are the ones of the initializer.  Unlike
+    creating new instances, the initializer isn't called: the values of the
+    other attributes are shared with the original instances and default
+    factories and ``instance_of`` checks aren't run for them.  The changed
+    values are checked against ``instance_of`` once for all copies.  Works
+    with immutable instances and all storages of :func:`attributes`.
+
+    :param objs: Instances of classes decorated by :func:`attributes`.
+    :type objs: iterable
+
+    :rtype: list
+
+    :raises TypeError: If a keyword argument doesn't belong to an attribute
+        or if a value isn't an instance of the ``instance_of`` of its
+        attribute.
+    :raises TypeError: If an instance's class hasn't been decorated by
+        :func:`attributes`.
+
+    .. versionadded:: 15.0
+    """
+    kw_names = sorted(changes)
+    values = [changes[kw_name] for kw_name in kw_names]
+    copiers = {}
+    rv = []
+    for obj in objs:
+        cl = obj.__class__
+        copier = copiers.get(cl)
+        if copier is None:
+            copier = copiers[cl] = _make_evolver(cl, obj, kw_names, values)
+        rv.append(copier(obj, *values))
+    return rv
+
+
+def _make_evolver(cl, obj, kw_names, values):
+    """
+    Validate the changed *values* of the attributes of *cl* that are called
+    *kw_names* in the initializer and return a function that copies
+    instances like *obj* using them.
+    """
+    s = schema(cl)
+    changed = {}
+    for kw_name, value in zip(kw_names, values):
+        a = s.by_kw_name.get(kw_name)
+        if a is None:
+            raise TypeError(
+                "evolve_many() got an unexpected keyword argument {0!r} for "
+                "'{1}'.".format(kw_name, cl.__name__)
+            )
+        if a.instance_of is not None and not isinstance(value, a.instance_of):
+            raise TypeError(
+                "Attribute '{0}' must be an instance of '{1}'."
+                .format(a.name, a.instance_of.__name__)
+            )
+        changed[a.name] = "c{0}".format(len(changed))
+
+    if isinstance(obj, tuple):
+        globs = {"new": tuple.__new__, "cl": cl}
+        script = _attrs_to_evolve_tuple_script(s.attributes, changed)
+        kind = "tuple evolve"
+    else:
+        globs = {"new": cl.__new__, "cl": cl, "set_": object.__setattr__}
+        has_dict = hasattr(obj, "__dict__")
+        slotted = frozenset(
+            a.name for a in s.attributes
+            if isinstance(getattr(cl, a.name, None),
+                          types.MemberDescriptorType)
+        )
+        script = _attrs_to_evolve_script(
+            s.attributes, changed, has_dict, slotted,
+        )
+        kind = "{0} evolve".format("dict" if has_dict else "slots")
+    return _make_function(
+        "evolve", script,
+        _unique_filename(
+            "{0} {1}".format(kind, ",".join(sorted(changed))), s.attributes,
+        ),
+        globs,
+    )
+
+
+def _attrs_to_evolve_tuple_script(attrs, changed):
+    """
+    Return a valid Python script of a function that copies an instance of the
+    ``tuple`` based ``cl`` with *attrs* while replacing the values of the
+    attributes in *changed* by its arguments.
+
+    *changed* maps attribute names to argument names.
+    """
+    return """\
+def evolve({args}):
+    '''
+    Automatically created by characteristic.
+    '''
+    return new(cl, ({values}))
+""".format(
+        args=", ".join(["obj"] + _sorted_args(changed)),
+        values="".join(
+            "{0}, ".format(changed.get(a.name, "obj[{0}]".format(i)))
+            for i, a in enumerate(attrs)
+        ),
+    )
+
+
+def _attrs_to_evolve_script(attrs, changed, has_dict, slotted):
+    """
+    Return a valid Python script of a function that copies an instance of
+    ``cl`` with *attrs* while replacing the values of the attributes in
+    *changed* by its arguments.
+
+    *changed* maps attribute names to argument names.  If *has_dict* is
+    `True`, the instance dictionary is copied as a whole.  Unchanged
+    attributes whose names are in *slotted* are copied one by one.
+    """
+    lines = ["new_obj = new(cl)"]
+    if has_dict:
+        lines.append("new_obj.__dict__.update(obj.__dict__)")
+    for a in attrs:
+        if a.name in changed:
+            lines.append(
+                "set_(new_obj, '{0}', {1})".format(a.name, changed[a.name])
+            )
+        elif a.name in slotted:
+            # Slots that haven't been set stay unset.
+            lines += [
+                "try:",
+                "    set_(new_obj, '{0}', obj.{0})".format(a.name),
+                "except AttributeError:",
+                "    pass",
+            ]
+    return """\
+def evolve({args}):
+    '''
+    Automatically created by characteristic.
+    '''
+    {lines}
+    return new_obj
+""".format(
+        args=", ".join(["obj"] + _sorted_args(changed)),
+        lines="\n    ".join(lines),
+    )
+
+
+def _sorted_args(changed):
+    """
+    Return the argument names of *changed* in the order they are passed.
+    """
+    return sorted(changed.values(), key=lambda arg: int(arg[1:]))
+
+
+def _attrs_to_dict_script(attrs):
+    """
+    Return a valid Python script of a function that creates a dictionary that
+    maps the keyword argument names of *attrs* to their values.
+    """
+    return """\
+def attrs_to_dict(obj):
+    '''
+    Automatically created by characteristic.
+    '''
+    return {{{items}}}
+""".format(items=", ".join("'{0}': obj.{1}".format(a._kw_name, a.name)
+                           for a in attrs))
+
+
+def dump_jsonl(cl, objs, f):
+    """
+    Write *objs* to the text file *f* as JSON lines.
+
+    Every line is a JSON object that maps the initializer keyword argument
+    names of the attributes of *cl* to their values.  *objs* is consumed
+    lazily, so arbitrarily many instances can be written in constant memory.
+
+    :param cl: A class decorated by :func:`attributes`.
+    :type cl: type
+
+    :param objs: Instances of *cl*.
+    :type objs: iterable
+
+    :param f: A file opened for writing in text mode.
+
+    :return: The number of lines written.
+    :rtype: int
+
+    .. versionadded:: 15.0
+    """
+    attrs = _init_attributes(cl)
+    attrs_to_dict = _make_function(
+        "attrs_to_dict", _attrs_to_dict_script(attrs),
+        _unique_filename("dict", attrs), {},
+    )
+    dumps = json.dumps
+    objs = iter(objs)
+    count = 0
+    for chunk in iter(lambda: list(islice(objs, 1024)), []):
+        f.write("".join(dumps(attrs_to_dict(obj)) + "\n" for obj in chunk))
+        count += len(chunk)
+    return count
+
+
+# How many chunks of lines load_jsonl() hands to a pool at once.
+_POOL_CHUNKS = 8
+
+
+def load_jsonl(cl, f, pool=None, chunksize=1024):
+    """
+    Lazily create instances of *cl* from the JSON lines in the text file *f*.
+
+    Each line has to be a JSON object that maps initializer keyword argument
+    names to values as written by :func:`dump_jsonl`.  Blank lines are
+    skipped.  Lines are read and parsed in chunks, so at most a few chunks
+    are held in memory no matter how big *f* is.
+
+    :param cl: A class decorated by :func:`attributes`.
+    :type cl: type
+
+    :param f: A file opened for reading in text mode.
+
+    :param pool: If passed, the chunks are parsed in parallel using the
+        ``map`` method of *pool*, e.g. a :class:`multiprocessing.pool.Pool`,
+        eight chunks at a time.  The instances are still created by the
+        calling process.
+
+    :param chunksize: How many lines are read and parsed at once.
+    :type chunksize: int
+
+    :rtype: generator of *cl*
+
+    .. versionadded:: 15.0
+    """
+    lines = (line for line in f if line.strip())
+    chunks = iter(lambda: list(islice(lines, chunksize)), [])
+    if pool is None:
+        batches = (_loads_lines(chunk) for chunk in chunks)
+    else:
+        batches = _map_bounded(pool, _loads_lines, chunks, _POOL_CHUNKS)
+    for batch in batches:
+        for d in batch:
+            yield cl(**d)
+
+
+def _loads_lines(lines):
+    """
+    Parse the JSON objects *lines* using a single call to :func:`json.loads`.
+    """
+    return json.loads("[" + ",".join(lines) + "]")
+
+
+def _map_bounded(pool, func, iterable, n):
+    """
+    Lazily apply *func* to the items of *iterable* using the ``map`` method of
+    *pool* on *n* items at a time.
+
+    Unlike ``imap``, that doesn't read ahead of the consumer, so the memory
+    use is bounded.
+    """
+    while True:
+        items = list(islice(iterable, n))
+        if not items:
+            return
+        for result in pool.map(func, items, 1):
+            yield result
+
+
+_STRUCT_CODES = {
+    bool: "?",
+    int: "q",
+    float: "d",
+}
+
+
+def record_struct(cl):
+    """
+    Derive a fixed-size binary layout for the attributes of *cl*.
+
+    :param cl: A class decorated by :func:`attributes` whose attributes that
+        are initialized by :func:`with_init` all have an ``instance_of`` of
+        either :class:`int`, :class:`float`, or :class:`bool`.  Integers are
+        stored as signed 64 bit values.
+    :type cl: type
+
+    :rtype: :class:`struct.Struct`
+
+    :raises TypeError: If an attribute doesn't have a fixed-size
+        ``instance_of``.
+
+    .. versionadded:: 15.0
+    """
+    codes = []
+    for a in _init_attributes(cl):
+        try:
+            codes.append(_STRUCT_CODES[a.instance_of])
+        except KeyError:
+            raise TypeError(
+                "Attribute '{0}' doesn't have a fixed-size instance_of."
+                .format(a.name)
+            )
+    return struct.Struct("<" + "".join(codes))
+
+
+def write_records(cl, objs, f):
+    """
+    Write *objs* to the binary file *f* using the layout of
+    :func:`record_struct`.
+
+    :param cl: The class of *objs*.
+    :type cl: type
+
+    :param objs: Instances of *cl*.  They are consumed lazily.
+    :type objs: iterable
+
+    :param f: A file opened for writing in binary mode.
+
+    :return: The number of records written.
+    :rtype: int
+
+    .. versionadded:: 15.0
+    """
+    pack_record = record_struct(cl).pack
+    attrs_to_tuple = _make_attrs_to_tuple(_init_attributes(cl))
+    count = 0
+    chunk = []
+    for obj in objs:
+        chunk.append(pack_record(*attrs_to_tuple(obj)))
+        if len(chunk) == 4096:
+            f.write(b"".join(chunk))
+            count += len(chunk)
+            chunk = []
+    f.write(b"".join(chunk))
+    return count + len(chunk)
+
+
+class MappedRecords(object):
+    """
+    A read-only sequence of instances of *cl* that are read from a file that
+    has been written by :func:`write_records`.
+
+    The file is memory-mapped and instances are only created when they are
+    accessed, so random access works in constant memory no matter how big
+    the file is.
+
+    :param cl: The class of the records.
+    :type cl: type
+
+    :param f: A file opened for reading in binary mode.  It has to stay open
+        as long as the records are accessed.
+
+    Slicing returns a list of instances.  Instances are context managers that
+    close the memory map on exit.
+
+    .. versionadded:: 15.0
+    """
+    def __init__(self, cl, f):
+        self._struct = record_struct(cl)
+        self._from_row = _make_from_row(cl, _init_attributes(cl))
+        size = os.fstat(f.fileno()).st_size
+        if size % self._struct.size:
+            raise ValueError(
+                "File size {0} isn't a multiple of the record size {1}."
+                .format(size, self._struct.size)
+            )
+        self._len = size // self._struct.size
+        self._closed = False
+        if size:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # Empty files can't be mapped.
+            self._map = None
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._read(range(*i.indices(self._len)))
+        try:
+            i = index(i)
+        except TypeError:
+            raise TypeError(
+                "Record indices must be integers or slices, not {0}."
+                .format(i.__class__.__name__)
+            )
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("Record index out of range.")
+        return self._from_row(
+            *self._struct.unpack_from(self._mapped(), i * self._struct.size)
+        )
+
+    def __iter__(self):
+        m = self._mapped()
+        unpack_from = self._struct.unpack_from
+        size = self._struct.size
+        for offset in range(0, self._len * size, size):
+            yield self._from_row(*unpack_from(m, offset))
+
+    def _read(self, indexes):
+        """
+        Return a list of the records at *indexes*, which must be in range.
+        """
+        m = self._mapped()
+        unpack_from = self._struct.unpack_from
+        size = self._struct.size
+        from_row = self._from_row
+        return [from_row(*unpack_from(m, i * size)) for i in indexes]
+
+    def _mapped(self):
+        """
+        Return the memory map.
+
+        :raises ValueError: If the records have been closed.
+        """
+        if self._closed:
+            raise ValueError("I/O operation on closed records.")
+        return self._map
+
+    def close(self):
+        """
+        Close the memory map.  Closing more than once has no effect.
+        """
+        self._closed = True
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _async_attributes(cl):
+    """
+    Return the attributes of *cl* that have an ``async_default_factory`` and
+    are initialized by :func:`with_init`.
+    """
+    return [a for a in _init_attributes(cl)
+            if a.async_default_factory is not None]
+
+
+# Native coroutines are a syntax error on older Pythons, hence the source.
+_ASYNC_SOURCE = '''\
+async def acreate(cl, **kw):
+    """
+    Instantiate *cl* using *kw* after awaiting the ``async_default_factory``
+    of all attributes that are missing from *kw* concurrently.
+
+    :param cl: A class decorated by :func:`attributes`.
+    :type cl: type
+
+    :rtype: *cl*
+
+    .. versionadded:: 15.0
+    """
+    # Importing asyncio is slow, so don't make everyone pay for it.
+    import asyncio
+
+    pending = [a for a in _async_attributes(cl) if a._kw_name not in kw]
+    values = await asyncio.gather(
+        *[a.async_default_factory() for a in pending]
+    )
+    for a, value in zip(pending, values):
+        kw[a._kw_name] = value
+    return cl(**kw)
+
+
+async def acreate_many(cl, rows):
+    """
+    Instantiate *cl* once for every dictionary of keyword arguments in *rows*
+    after awaiting all missing ``async_default_factory`` values of all rows
+    concurrently.
+
+    :param cl: A class decorated by :func:`attributes`.
+    :type cl: type
+
+    :param rows: Keyword arguments for each instance.  They are not modified.
+    :type rows: iterable of dicts
+
+    :rtype: ``list`` of *cl*
+
+    .. versionadded:: 15.0
+    """
+    import asyncio
+
+    attrs = _async_attributes(cl)
+    kws = [dict(row) for row in rows]
+    pending = [(kw, a) for kw in kws for a in attrs if a._kw_name not in kw]
+    values = await asyncio.gather(
+        *[a.async_default_factory() for _, a in pending]
+    )
+    for (kw, a), value in zip(pending, values):
+        kw[a._kw_name] = value
+    return [cl(**kw) for kw in kws]
+'''
+
+_ASYNC_FILENAME = "<characteristic async>"
+
+if sys.version_info[0:2] >= (3, 5):  # pragma: no branch
+    exec_(compile(_ASYNC_SOURCE, _ASYNC_FILENAME, "exec"), globals(),
+          globals())
+    # Let tracebacks and debuggers show the source.
+    linecache.cache[_ASYNC_FILENAME] = (
+        len(_ASYNC_SOURCE),
+        None,
+        _ASYNC_SOURCE.splitlines(True),
+        _ASYNC_FILENAME
+    )
+    __all__ += ["acreate", "acreate_many"]  # noqa
+
+
+def _unique_filename(kind, attrs):
+    """
+    Return a file name for generated code of *kind* that is unique to the
+    names and keyword argument names of *attrs*.
+    """
+    sha1 = hashlib.sha1()
+    sha1.update(
+        repr([(a.name, a._kw_name) for a in attrs]).encode("utf-8")
+    )
+    return "<characteristic generated {0} {1}>".format(kind, sha1.hexdigest())
+
+
+def _make_function(name, script, filename, globs):
+    """
+    Compile *script*, run it with *globs* as globals, and return the function
+    called *name* that it defines.
+
+    If the code of *script* has been compiled ahead of time (see
+    :func:`emit_module`), the function is created from it directly.
+    """
+    if _RECORDED is not None:
+        _RECORDED.append(script)
+    if _PRECOMPILED:
+        code = _PRECOMPILED.get(_script_key(script))
+        if code is not None:
+            globs.setdefault("__builtins__", __builtins__)
+            return types.FunctionType(code, globs, name)
+    locs = {}
+    bytecode = _compile_cached(script, filename)
+    exec_(bytecode, globs, locs)
+    # In order of debuggers like PDB being able to step through the code,
+    # we add a fake linecache entry.
+    filename = bytecode.co_filename
+    linecache.cache[filename] = (
+        len(script),
+        None,
+        script.splitlines(True),
+        filename
+    )
+    return locs[name]
+
+
+def _make_attrs_to_tuple(attrs):
+    """
+    Return a function that creates a tuple of all values of *attrs* of an
+    object.
+    """
+    return _make_function(
+        "attrs_to_tuple", _attrs_to_tuple_script(attrs),
+        _unique_filename("tuple", attrs), {},
+    )
+
+
+def _make_from_row(cl, attrs):
+    """
+    Return a function that instantiates *cl* from the values of *attrs* that
+    are passed as positional arguments.
+    """
+    return _make_function(
+        "from_row", _attrs_to_from_row_script(attrs),
+        _unique_filename("from_row", attrs), {"cl": cl},
+    )
+
+
+def _attrs_to_tuple_script(attrs):
+    """
+    Return a valid Python script of a function that creates a tuple of all
+    values of *attrs* using direct attribute access.
+    """
+    return """\
+def attrs_to_tuple(obj):
+    '''
+    Create a tuple of all values of *obj*'s attributes.
+
+    Automatically created by characteristic.
+    '''
+    return ({values})
+""".format(values="".join("obj.{0}, ".format(a.name) for a in attrs))
+
+
+def _attrs_to_eq_script(attrs):
+    """
+    Return a valid Python script of an equality method for *attrs* that
+    compares them one by one like tuples would but without creating any.
+    """
+    lines = []
+    for a in attrs:
+        lines += [
+            "if not (self.{0} is other.{0} or self.{0} == other.{0}):"
+            .format(a.name),
+            "    return False",
+        ]
+    return """\
+def characteristic_eq(self, other):
+    '''
+    Automatically created by characteristic.
+    '''
+    if other is self:
+        return True
+    if other.__class__ is not self.__class__:
+        return NotImplemented
+    {checks}
+    return True
+""".format(checks="\n    ".join(lines))
+
+
+def _attrs_to_script(attrs, track_instances=False, frozen=False,
+                     trace_init=False, sparse=False, mark=False):
     """
     Return a valid Python script of an initializer for *attrs*.
+
+    If *track_instances* is `True`, the initializer records the instance in
+    the ``stats`` global after the original initializer returns.
+
+    If *frozen* is `True`, attributes are set using ``object_setattr``
+    instead of the immutability ``sentry`` unless the class of the instance
+    overrides ``__setattr__`` again, even if only underneath another
+    ``sentry``.
+
+    If *trace_init* is `True`, the time of each step is measured using the
+    ``timer`` global and passed to the ``add`` global.
+
+    If *sparse* is `True`, values that are identical to their defaults aren't
+    stored.
+
+    If *mark* is `True`, the instance is counted in the ``initializing``
+    global while the attributes are set, which is how the immutability
+    sentry on PyPy recognizes initializers.
     """
-    if all(a.default_value is NOTHING
-           and a.default_factory is None
-           and a.instance_of is None
-           for a in attrs) and not PY26:
-        # Simple version does not work with Python 2.6 because of
-        # http://bugs.python.org/issue10221
-        lines = _simple_init(attrs)
+    store = "setattr" if frozen else "attribute"
+    if trace_init is True:
+        lines = _traced_init(attrs, store, sparse)
     else:
-        lines = _verbose_init(attrs)
+        lines = _setters(attrs, store, sparse)
+    if mark is True and lines:
+        lines = [
+            "_key = id(self)",
+            "initializing[_key] = initializing.get(_key, 0) + 1",
+            "try:",
+        ] + ["    " + line for line in lines] + [
+            "finally:",
+            "    _count = initializing.pop(_key) - 1",
+            "    if _count:",
+            "        initializing[_key] = _count",
+        ]
+    if frozen is True and attrs:
+        lines = [
+            "_setattr = self.__class__.__setattr__",
+            "if (_setattr == sentry and",
+            "        self.__class__.__original_setattr__ == object_setattr):",
+            "    _setattr = object_setattr",
+        ] + lines
 
     return """\
 def characteristic_init(self, *args, **kw):
@@ -604,18 +2864,145 @@ def characteristic_init(self, *args, **kw):
     '''
     {setters}
     self.__original_init__(*args, **kw)
-""".format(setters="\n    ".join(lines))
+{tracking}""".format(
+        setters="\n    ".join(lines),
+        tracking="""\
+    stats.constructed += 1
+    stats.track(self)
+""" if track_instances else "",
+    )
+
+
+def _attrs_to_new_script(attrs):
+    """
+    Return a valid Python script of a ``__new__`` method that creates a
+    ``tuple`` subclass instance from the values of *attrs*.
+    """
+    return """\
+def characteristic_new(cls, **kw):
+    '''
+    Tuple constructor automatically created by characteristic.
+    '''
+    {setters}
+    if kw:
+        raise TypeError(
+            "%s() got an unexpected keyword argument %r"
+            % (cls.__name__, next(iter(kw)))
+        )
+    return new(cls, ({values}))
+""".format(
+        setters="\n    ".join(_setters(attrs, "local")),
+        values="".join("v{0}, ".format(i) for i in range(len(attrs))),
+    )
+
+
+def _setters(attrs, store, sparse=False):
+    """
+    Return a list of lines that pop the values of *attrs* from ``kw`` and
+    store them according to *store* (see :func:`_setter`) and *sparse* (see
+    :func:`_verbose_init`).
+    """
+    if all(a.default_value is NOTHING
+           and a.default_factory is None
+           and a.default_pool is None
+           and a.instance_of is None
+           for a in attrs) and not PY26:
+        # Simple version does not work with Python 2.6 because of
+        # http://bugs.python.org/issue10221
+        return _simple_init(attrs, store)
+    else:
+        return _verbose_init(attrs, store, sparse)
+
+
+def _target(i, a, store):
+    """
+    Return the expression that holds the value of the *i*-th attribute *a*.
+
+    ``"attribute"`` and ``"setattr"`` *store* it on ``self``, ``"local"`` in
+    a local variable.
+    """
+    if store == "local":
+        return "v{0}".format(i)
+    return "self." + a.name
+
+
+def _setter(i, a, value, store):
+    """
+    Return a statement that stores *value* as the *i*-th attribute *a*.
+
+    ``"setattr"`` *store* uses the ``_setattr`` local instead of an
+    assignment.
+    """
+    if store == "setattr":
+        return "_setattr(self, '{0}', {1})".format(a.name, value)
+    return "{0} = {1}".format(_target(i, a, store), value)
+
+
+def _traced_init(attrs, store="attribute", sparse=False):
+    """
+    Create a list of lines that initialize *attrs* like
+    :func:`_verbose_init` while measuring every step.
+    """
+    lines = []
+    for i, a in enumerate(attrs):
+        lines += [
+            "t = timer()",
+            "v = kw.pop('{0}', NOTHING)".format(a._kw_name),
+            "add('{0}', 'pop', timer() - t)".format(a.name),
+            "if v is NOTHING:",
+        ]
+        if a.share_default is True:
+            default, step = "shared_{0}".format(i), "default"
+        elif a.default_value is not NOTHING:
+            default, step = "attrs[{0}].default_value".format(i), "default"
+        elif a.default_factory is not None:
+            default, step = "attrs[{0}].default_factory()".format(i), "factory"
+        elif a.default_pool is not None:
+            default = "attrs[{0}].default_pool.acquire()".format(i)
+            step = "pool"
+        else:
+            default = step = None
+        if default is None:
+            lines.append(
+                "     raise ValueError(\"Missing keyword value for "
+                "'{0}'.\")".format(a._kw_name),
+            )
+        else:
+            lines += [
+                "    t = timer()",
+                "    v = " + default,
+                "    add('{0}', '{1}', timer() - t)".format(a.name, step),
+            ]
+        if a.instance_of:
+            lines += [
+                "t = timer()",
+                "ok = isinstance(v, attrs[{0}].instance_of)".format(i),
+                "add('{0}', 'isinstance', timer() - t)".format(a.name),
+                "if not ok:",
+                "    raise TypeError(\"Attribute '{0}' must be an instance "
+                "of '{1}'.\")".format(a.name, a.instance_of.__name__),
+            ]
+        if sparse is True and step == "default":
+            lines += [
+                "if v is not {0}:".format(default),
+                "    " + _setter(i, a, "v", store),
+            ]
+        else:
+            lines.append(_setter(i, a, "v", store))
+    return lines
 
 
-def _simple_init(attrs):
+def _simple_init(attrs, store="attribute"):
     """
     Create an init for *attrs* that doesn't care about defaults, default
     factories, or argument validators.  This is a common case thus it's worth
     optimizing for.
     """
     lines = ["try:"]
-    for a in attrs:
-        lines.append("    self.{a.name} = kw.pop('{a._kw_name}')".format(a=a))
+    for i, a in enumerate(attrs):
+        lines.append(
+            "    " + _setter(i, a, "kw.pop('{0}')".format(a._kw_name), store)
+        )
 
     lines += [
         # We include "pass" here in case attrs is empty.  Otherwise the "try"
@@ -628,45 +3015,78 @@ def _simple_init(attrs):
     return lines
 
 
-def _verbose_init(attrs):
+def _verbose_init(attrs, store="attribute", sparse=False):
     """
     Create return a list of lines that initialize *attrs* while honoring
     default values.
+
+    If *sparse* is `True`, values that are identical to the default value or
+    the shared default of their attribute aren't stored.
     """
     lines = []
     for i, a in enumerate(attrs):
         # attrs is passed into the the exec later to enable default_value
         # and default_factory.  To find it, enumerate and 'i' are used.
-        lines.append(
-            "self.{a.name} = kw.pop('{a._kw_name}', {default})"
-            .format(
-                a=a,
-                # Save a lookup for the common case of no default value.
-                default="attrs[{i}].default_value".format(i=i)
-                if a.default_value is not NOTHING else "NOTHING"
-            )
+        if a.share_default is True:
+            # Shared defaults are computed once and passed as globals.
+            default = "shared_{i}".format(i=i)
+        elif a.default_value is not NOTHING:
+            default = "attrs[{i}].default_value".format(i=i)
+        else:
+            # Save a lookup for the common case of no default value.
+            default = "NOTHING"
+        value = "kw.pop('{a._kw_name}', {default})".format(
+            a=a, default=default,
         )
-        if a.default_value is NOTHING:
-            lines.append("if self.{a.name} is NOTHING:".format(a=a))
-            if a.default_factory is None:
+        if sparse is True and _has_class_default(a):
+            lines.append("v = " + value)
+            lines += _instance_of_check(i, a, "v")
+            lines += [
+                "if v is not {0}:".format(default),
+                "    " + _setter(i, a, "v", store),
+            ]
+            continue
+        lines.append(_setter(i, a, value, store))
+        target = _target(i, a, store)
+        if a.default_value is NOTHING and a.share_default is False:
+            lines.append("if {0} is NOTHING:".format(target))
+            if a.default_pool is not None:
+                lines.append("    " + _setter(
+                    i, a, "attrs[{0}].default_pool.acquire()".format(i), store,
+                ))
+            elif a.default_factory is None:
                 lines.append(
                     "     raise ValueError(\"Missing keyword value for "
                     "'{a._kw_name}'.\")".format(a=a),
                 )
             else:
-                lines.append(
-                    "    self.{a.name} = attrs[{i}].default_factory()"
-                    .format(a=a, i=i)
-                )
-        if a.instance_of:
-            lines.append(
-                "if not isinstance(self.{a.name}, attrs[{i}].instance_of):\n"
-                .format(a=a, i=i)
-            )
-            lines.append(
-                "    raise TypeError(\"Attribute '{a.name}' must be an"
-                " instance of '{type_name}'.\")"
-                .format(a=a, type_name=a.instance_of.__name__)
-            )
+                lines.append("    " + _setter(
+                    i, a, "attrs[{0}].default_factory()".format(i), store,
+                ))
+        lines += _instance_of_check(i, a, target)
 
     return lines
+
+
+def _instance_of_check(i, a, target):
+    """
+    Return lines that check the value in *target* against the
+    ``instance_of`` of the *i*-th attribute *a* if it has one.
+    """
+    if not a.instance_of:
+        return []
+    return [
+        "if not isinstance({target}, attrs[{i}].instance_of):\n"
+        .format(target=target, i=i),
+        "    raise TypeError(\"Attribute '{a.name}' must be an"
+        " instance of '{type_name}'.\")"
+        .format(a=a, type_name=a.instance_of.__name__),
+    ]
+
+
+def _has_class_default(a):
+    """
+    Check whether the value of *a* can be stored on the class in sparse
+    storage because all instances share its default.
+    """
+    return a.share_default is True or a.default_value is not NOTHING
@@ -46,7 +46,7 @@ class PyTest(TestCommand):
         # import here, cause outside the eggs aren't loaded
         import pytest
         errno = pytest.main(self.pytest_args or [] +
-                            ["test_characteristic.py"])
+                            ["test_characteristic.py", "test_performance.py"])
         sys.exit(errno)
 
 
@@ -61,7 +61,8 @@ if __name__ == "__main__":
         license="MIT",
         author="Hynek Schlawack",
         author_email="hs@ox.cx",
-        py_modules=["characteristic", "test_characteristic"],
+        py_modules=["characteristic", "test_characteristic",
+                    "test_performance"],
         classifiers=[
             "Development Status :: 5 - Production/Stable",
             "Intended Audience :: Developers",
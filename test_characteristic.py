@@ -1,25 +1,56 @@
 from __future__ import absolute_import, division, print_function
 
+import gc
+import inspect
+import io
+import json
 import linecache
+import pickle
 import sys
+import threading
 import warnings
+import weakref
 
 import pytest
 
+import characteristic
+
 from characteristic import (
     Attribute,
+    MappedRecords,
+    HAS_SIGNATURE,
     NOTHING,
     PY26,
+    Pool,
+    Schema,
     _attrs_to_script,
     _ensure_attributes,
     attributes,
+    deep_eq,
+    diff,
+    dump_jsonl,
+    emit_module,
+    evolve_many,
     immutable,
+    init_trace_report,
+    instance_stats,
+    load_jsonl,
+    pack,
+    record_struct,
+    release_pooled,
+    schema,
+    unpack,
+    validate_columns,
     with_cmp,
     with_init,
     with_repr,
+    write_records,
 )
 
 PY2 = sys.version_info[0] == 2
+HAS_ASYNC = sys.version_info[0:2] >= (3, 5)
+# Closure cells of methods can only be updated on 3.7 and later.
+HAS_WRITABLE_CELLS = sys.version_info[0:2] >= (3, 7)
 
 warnings.simplefilter("always")
 
@@ -124,7 +155,8 @@ class TestAttribute(object):
             "exclude_from_init=True, exclude_from_repr=True, "
             "exclude_from_immutable=True, "
             "default_value=42, default_factory=None, instance_of=<{0} 'str'>,"
-            " init_aliaser=None)>"
+            " init_aliaser=None, async_default_factory=None, "
+            "share_default=False, default_pool=None)>"
         ).format("type" if PY2 else "class") == repr(a)
 
     def test_eq_different_types(self):
@@ -286,6 +318,112 @@ class TestWithCmp(object):
         """
         assert hash(CmpC(1, 2)) != hash(CmpC(1, 1))
 
+    def test_hash_equal(self):
+        """
+        Equal objects have equal hashes.
+        """
+        assert hash(CmpC(1, 2)) == hash(CmpC(1, 2))
+
+    def test_hash_salted_per_class(self):
+        """
+        Instances of different classes with equal values hash differently.
+        """
+        @with_cmp(["a", "b"])
+        class C(object):
+            def __init__(self, a, b):
+                self.a = a
+                self.b = b
+
+        assert hash(CmpC(1, 2)) != hash(C(1, 2))
+
+    def test_no_attributes(self):
+        """
+        Instances of classes without attributes to compare are all equal and
+        orderable.
+        """
+        @with_cmp([])
+        class C(object):
+            pass
+
+        assert C() == C()
+        assert C() <= C()
+        assert not (C() < C())
+
+    def test_eq_only(self):
+        """
+        If *order* and *hash* are `False`, only __eq__ and __ne__ are added
+        and instances aren't hashable.
+        """
+        @with_cmp(["a"], order=False, hash=False)
+        class C(object):
+            def __init__(self, a):
+                self.a = a
+
+        assert C(1) == C(1)
+        assert C(1) != C(2)
+        assert None is C.__hash__
+        with pytest.raises(TypeError):
+            hash(C(1))
+        assert "__lt__" not in C.__dict__
+        assert NotImplemented == C(1).__lt__(C(2))
+
+    def test_order_only(self):
+        """
+        If *eq* and *hash* are `False`, only the orderings are added and
+        equality and hashing stay identity-based.
+        """
+        @with_cmp(["a"], eq=False, hash=False)
+        class C(object):
+            def __init__(self, a):
+                self.a = a
+
+        c = C(1)
+
+        assert C(1) < C(2) <= C(2)
+        assert C(1) != C(1)
+        assert c == c
+        assert object.__hash__(c) == hash(c)
+        assert "__eq__" not in C.__dict__
+        assert "__hash__" not in C.__dict__
+
+    def test_hash_only(self):
+        """
+        If *eq* and *order* are `False`, only __hash__ is added.
+        """
+        @with_cmp(["a"], eq=False, order=False)
+        class C(object):
+            def __init__(self, a):
+                self.a = a
+
+        assert hash(C(1)) == hash(C(1))
+        assert C(1) != C(1)
+        assert "__eq__" not in C.__dict__
+        assert "__lt__" not in C.__dict__
+
+    def test_shared_methods(self):
+        """
+        All decorated classes share the same methods and only keep the names
+        of their attributes.
+        """
+        @with_cmp(["b"])
+        class C(object):
+            def __init__(self, b):
+                self.b = b
+
+        for name in ["__ne__", "__lt__", "__le__", "__gt__", "__ge__",
+                     "__hash__"]:
+            assert getattr(CmpC, name) is getattr(C, name)
+        assert (C, 1) == C.__characteristic_cmp__(C(1))
+
+    def test_identity(self):
+        """
+        Instances are equal to themselves without comparing attributes.
+        """
+        nan = float("nan")
+        c = CmpC(nan, 1)
+        assert c == c
+        assert not (c != c)
+
     def test_Attribute_exclude_from_cmp(self):
         """
         Ignores attribute if exclude_from_cmp=True.
@@ -325,6 +463,19 @@ class TestReprAttrs(object):
 
         assert "<C(b=2)>" == repr(C(1, 2))
 
+    def test_shared_method(self):
+        """
+        All decorated classes share the same method and only keep the names
+        of their attributes.
+        """
+        @with_repr(["b"])
+        class C(object):
+            b = 2
+
+        assert ReprC.__repr__ is C.__repr__
+        assert ("b",) == C.__characteristic_repr__
+        assert "<C(b=2)>" == repr(C())
+
 
 @with_init([Attribute("a"), Attribute("b")])
 class InitC(object):
@@ -443,6 +594,56 @@ class TestWithInit(object):
         o2 = C()
         assert o1.a is not o2.a
 
+    def test_share_default(self):
+        """
+        A shared default factory is called only once and its result is used
+        for all instances that don't get a value passed.
+        """
+        calls = []
+
+        def factory():
+            calls.append(None)
+            return frozenset()
+
+        @with_init([Attribute("a", default_factory=factory,
+                              share_default=True)])
+        class C(object):
+            pass
+
+        o1 = C()
+        o2 = C()
+        assert o1.a is o2.a
+        assert 42 == C(a=42).a
+        assert 1 == len(calls)
+
+    def test_share_default_needs_factory(self):
+        """
+        Raises ValueError if share_default is passed without a factory.
+        """
+        with pytest.raises(ValueError) as e:
+            Attribute("a", share_default=True)
+        assert (
+            "share_default needs a default_factory to share."
+            == e.value.args[0]
+        )
+
+    @pytest.mark.parametrize("kw", [
+        {"default_value": 42},
+        {"default_factory": list},
+        {"async_default_factory": list},
+    ])
+    def test_default_pool_exclusive(self, kw):
+        """
+        Raises ValueError if default_pool is passed together with another
+        default.
+        """
+        with pytest.raises(ValueError) as e:
+            Attribute("a", default_pool=Pool(list), **kw)
+        assert (
+            "Passing default_pool together with another default is "
+            "ambiguous." == e.value.args[0]
+        )
+
     def test_underscores(self):
         """
         with_init takes keyword aliasing into account.
@@ -565,6 +766,47 @@ class TestWithInit(object):
             != C2.__init__.__code__.co_filename
         )
 
+    def test_code_shared(self):
+        """
+        Equal attributes share the compiled initializer instead of being
+        compiled again.
+        """
+        attrs = [Attribute("a"), Attribute("b", default_value=42)]
+
+        @with_init(attrs[:])
+        class C1(object):
+            pass
+
+        @with_init(attrs[:])
+        class C2(object):
+            pass
+
+        assert C1.__init__.__code__ is C2.__init__.__code__
+
+    def test_code_shared_different_defaults(self):
+        """
+        Attributes that only differ in their defaults share the compiled
+        initializer and its linecache entry instead of growing the caches
+        with every class.
+        """
+        def make():
+            @with_init([Attribute("a", default_factory=lambda: []),
+                        Attribute("b", default_value=object())])
+            class C(object):
+                pass
+            return C
+
+        C1 = make()
+        cached = len(characteristic._CODE_CACHE)
+        lines = len(linecache.cache)
+        classes = [make() for _ in range(100)]
+
+        assert cached == len(characteristic._CODE_CACHE)
+        assert lines == len(linecache.cache)
+        assert all(C.__init__.__code__ is C1.__init__.__code__
+                   for C in classes)
+        assert [] == classes[0]().a
+
     def test_no_attributes(self):
         """
         Specifying no attributes doesn't raise an exception.
@@ -575,280 +817,2570 @@ class TestWithInit(object):
         C()
 
 
-class TestAttributes(object):
-    def test_leaves_init_alone(self):
+@pytest.mark.skipif(not HAS_SIGNATURE, reason="Needs inspect.Signature.")
+class TestSignature(object):
+    @pytest.mark.parametrize("storage", ["dict", "tuple"])
+    def test_keyword_kw_name(self, storage):
         """
-        If *apply_with_init* or *create_init* is `False`, leave __init__ alone.
+        Classes whose keyword argument names are Python keywords can be
+        decorated and keep the generic signature.
         """
-        @attributes(["a"], apply_with_init=False)
-        class C(object):
+        @attributes([Attribute("_from"), "to"], storage=storage)
+        class Mail(object):
             pass
 
-        @attributes(["a"], create_init=False)
-        class CDeprecated(object):
+        m = Mail(**{"from": "a", "to": "b"})
+
+        assert ("a", "b") == (m._from, m.to)
+        assert "kw" in inspect.signature(Mail).parameters
+
+    def test_signature(self):
+        """
+        The initializer has keyword-only arguments with the aliased names,
+        defaults, and instance_of annotations of the attributes.
+        """
+        @with_init([Attribute("a", instance_of=int),
+                    Attribute("_b", default_value=42),
+                    Attribute("c", default_factory=list),
+                    Attribute("d", default_factory=frozenset,
+                              share_default=True)])
+        class C(object):
             pass
 
-        obj1 = C()
-        obj2 = CDeprecated()
+        sig = inspect.signature(C)
+        params = list(sig.parameters.values())
 
-        with pytest.raises(AttributeError):
-            obj1.a
-        with pytest.raises(AttributeError):
-            obj2.a
+        assert ["a", "b", "c", "d"] == [p.name for p in params]
+        assert all(inspect.Parameter.KEYWORD_ONLY == p.kind for p in params)
+        assert inspect.Parameter.empty is params[0].default
+        assert int is params[0].annotation
+        assert 42 == params[1].default
+        assert NOTHING is params[2].default
+        assert frozenset() == params[3].default
+        assert {"a": int} == C.__init__.__annotations__
+        assert {"a": 1, "b": 2} == sig.bind(a=1, b=2).arguments
 
-    def test_wraps_init(self):
+    def test_original_arguments(self):
         """
-        If *create_init* is `True`, build initializer.
+        Arguments of the original initializer are kept.
         """
-        @attributes(["a", "b"], apply_with_init=True)
+        @with_init(["a"])
         class C(object):
-            pass
+            def __init__(self, x, *args, **kw):
+                pass
 
-        obj = C(a=1, b=2)
-        assert 1 == obj.a
-        assert 2 == obj.b
+        assert "(x, *args, a, **kw)" == str(inspect.signature(C))
 
-    def test_immutable(self):
+    def test_original_argument_shadowed(self):
         """
-        If *apply_immutable* is `True`, make class immutable.
+        Arguments of the original initializer that are attributes too appear
+        only once.
         """
-        @attributes(["a"], apply_immutable=True)
-        class ImmuClass(object):
+        @with_init(["a"])
+        class C(object):
+            def __init__(self, a=None):
+                pass
+
+        assert "(*, a)" == str(inspect.signature(C))
+
+    def test_per_class(self):
+        """
+        Classes that share the initializer code have their own signatures.
+        """
+        @with_init(["a"])
+        class C1(object):
             pass
 
-        obj = ImmuClass(a=42)
-        with pytest.raises(AttributeError):
-            obj.a = "23"
+        @with_init(["a"])
+        class C2(object):
+            def __init__(self, x):
+                pass
 
-    def test_apply_with_cmp(self):
+        assert "(*, a)" == str(inspect.signature(C1))
+        assert "(x, *, a)" == str(inspect.signature(C2))
+
+    def test_tuple_storage(self):
         """
-        Don't add cmp methods if *apply_with_cmp* is `False`.
+        Tuple based classes have a signature too.
         """
-        @attributes(["a"], apply_with_cmp=False)
+        assert "(*, x, y: int = 0)" == str(inspect.signature(TuplePoint))
+
+
+class TestInstanceStats(object):
+    def test_untracked(self):
+        """
+        Initializers don't track anything by default.
+        """
+        @with_init(["a"])
         class C(object):
             pass
 
-        obj = C(a=1)
-        if PY2:
-            assert None is getattr(obj, "__eq__", None)
-        else:
-            assert object.__eq__ == C.__eq__
+        C(a=1)
 
-    def test_apply_with_repr(self):
+        assert C not in instance_stats()
+        assert "stats" not in _attrs_to_script(
+            _ensure_attributes(["a"], NOTHING)
+        )
+
+    def test_counts(self):
         """
-        Don't add __repr__ if *apply_with_repr* is `False`.
+        Constructed instances are counted and alive instances are tracked
+        until they are collected.
         """
-        @attributes(["a"], apply_with_repr=False)
+        @with_init(["a"], track_instances=True)
         class C(object):
             pass
 
-        assert repr(C(a=1)).startswith("<test_characteristic.")
+        assert {"constructed": 0, "alive": 0} == instance_stats()[C]
+        i1 = C(a=1)
+        i2 = C(a=2)
+        assert {"constructed": 2, "alive": 2} == instance_stats()[C]
+        del i1
+        gc.collect()
+        assert {"constructed": 2, "alive": 1} == instance_stats()[C]
+        assert 2 == i2.a
 
-    def test_store_attributes(self):
+    def test_equal_instances(self):
         """
-        store_attributes is called on the class to store the attributes that
-        were passed in.
+        Equal instances are tracked separately.
         """
-        attrs = [Attribute("a"), Attribute("b")]
-
-        @attributes(
-            attrs, store_attributes=lambda cls, a: setattr(cls, "foo", a)
-        )
+        @attributes(["a"], track_instances=True)
         class C(object):
             pass
 
-        assert C.foo == attrs
+        objs = [C(a=1) for _ in range(5)]
 
-    def test_store_attributes_stores_Attributes(self):
+        assert {"constructed": 5, "alive": 5} == instance_stats()[C]
+        del objs[:3]
+        gc.collect()
+        assert {"constructed": 5, "alive": 2} == instance_stats()[C]
+
+    def test_unhashable(self):
         """
-        The attributes passed to store_attributes are always instances of
-        Attribute, even if they were simple strings when provided.
+        Instances of unhashable classes can be tracked.
         """
-        @attributes(["a", "b"])
+        @attributes(["a"], track_instances=True, hash=False)
         class C(object):
             pass
 
-        assert C.characteristic_attributes == [Attribute("a"), Attribute("b")]
+        objs = [C(a=1), C(a=1)]
 
-    def test_store_attributes_defaults_to_characteristic_attributes(self):
+        assert {"constructed": 2, "alive": 2} == instance_stats()[C]
+        assert [C(a=1)] * 2 == objs
+
+    def test_per_class(self):
         """
-        By default, store_attributes stores the attributes in
-        `characteristic_attributes` on the class.
+        Each class has its own statistics even if the attributes are equal.
         """
-        attrs = [Attribute("a")]
+        @with_init(["a"], track_instances=True)
+        class C1(object):
+            pass
 
-        @attributes(attrs)
-        class C(object):
+        @with_init(["a"], track_instances=True)
+        class C2(object):
             pass
 
-        assert C.characteristic_attributes == attrs
+        c1 = C1(a=1)  # noqa
+        assert 1 == instance_stats()[C1]["constructed"]
+        assert 0 == instance_stats()[C2]["constructed"]
 
-    def test_private(self):
+    def test_attributes(self):
         """
-        Integration test for name mangling/aliasing.
+        attributes() passes track_instances to with_init, also for slotted
+        classes.
         """
-        @attributes([Attribute("_a")])
+        @attributes(["a"], storage="slots", track_instances=True)
         class C(object):
             pass
-        c = C(a=42)
-        assert 42 == c._a
 
-    def test_private_no_alias(self):
+        c = C(a=1)  # noqa
+        assert {"constructed": 1, "alive": 1} == instance_stats()[C]
+
+    def test_forgets_classes(self):
         """
-        Integration test for name mangling/aliasing.
+        Statistics don't keep classes alive.
         """
-        @attributes([Attribute("_a", init_aliaser=None)])
+        @with_init(["a"], track_instances=True)
         class C(object):
             pass
-        c = C(_a=42)
-        assert 42 == c._a
 
-    def test_deprecation_create_init(self):
-        """
-        Emits a DeprecationWarning if `create_init` is used.
-        """
-        with warnings.catch_warnings(record=True) as w:
-            @attributes(["a"], create_init=False)
-            class C(object):
-                pass
-        assert (
-            '`create_init` has been deprecated in 14.0, please use '
-            '`apply_with_init`.'
-        ) == w[0].message.args[0]
-        assert issubclass(w[0].category, DeprecationWarning)
+        r = weakref.ref(C)
+        del C
+        gc.collect()
 
-    def test_deprecation_defaults(self):
+        assert r() is None
+
+
+class TestInitTrace(object):
+    def test_untraced(self):
         """
-        Emits a DeprecationWarning if `defaults` is used.
+        Initializers aren't traced by default.
         """
-        with warnings.catch_warnings(record=True) as w:
-            @attributes(["a"], defaults={"a": 42})
-            class C(object):
-                pass
-        assert (
-            '`defaults` has been deprecated in 14.0, please use the '
-            '`Attribute` class instead.'
-        ) == w[0].message.args[0]
-        assert issubclass(w[0].category, DeprecationWarning)
+        @with_init(["a"])
+        class C(object):
+            pass
 
-    def test_does_not_allow_extra_keyword_arguments(self):
+        C(a=1)
+
+        assert C not in [entry[0] for entry in init_trace_report()]
+        assert "timer" not in C.__init__.__code__.co_names
+
+    def test_steps(self):
         """
-        Keyword arguments other than the ones consumed are still TypeErrors.
+        Every step that runs is recorded per attribute.
         """
-        with pytest.raises(TypeError) as e:
-            @attributes(["a"], not_an_arg=12)
-            class C(object):
-                pass
-        assert e.value.args == (
-            "attributes() got an unexpected keyword argument 'not_an_arg'",
+        @attributes([Attribute("_a", instance_of=int),
+                     Attribute("b", default_value=2),
+                     Attribute("c", default_factory=list),
+                     Attribute("d", default_factory=set, share_default=True)],
+                    trace_init=True)
+        class C(object):
+            pass
+
+        c = C(a=1)
+        C(a=2, b=3, c=[], d=set())
+
+        assert (1, 2, [], set()) == (c._a, c.b, c.c, c.d)
+        steps = dict(
+            ((name, step), calls)
+            for cl, name, step, calls, _, _ in init_trace_report()
+            if cl is C
         )
+        assert {
+            ("_a", "pop"): 2,
+            ("_a", "isinstance"): 2,
+            ("b", "pop"): 2,
+            ("b", "default"): 1,
+            ("c", "pop"): 2,
+            ("c", "factory"): 1,
+            ("d", "pop"): 2,
+            ("d", "default"): 1,
+        } == steps
+
+    def test_errors(self):
+        """
+        Traced initializers raise the same errors.
+        """
+        @attributes([Attribute("a", instance_of=int)], trace_init=True,
+                    apply_immutable=True)
+        class C(object):
+            pass
 
-    def test_no_attributes(self):
+        with pytest.raises(ValueError) as e:
+            C()
+        assert "Missing keyword value for 'a'." == e.value.args[0]
+        with pytest.raises(TypeError) as e:
+            C(a="1")
+        assert (
+            "Attribute 'a' must be an instance of 'int'."
+        ) == e.value.args[0]
+        with pytest.raises(AttributeError):
+            C(a=1).a = 2
+
+    def test_ranking(self):
         """
-        Specifying no attributes doesn't raise an exception.
+        The report is ordered by total time and can be limited.
         """
-        @attributes([])
+        @with_init(["a", Attribute("b", default_factory=lambda: sum(
+            range(10000)
+        ))], trace_init=True)
         class C(object):
             pass
-        C()
 
+        for _ in range(5):
+            C(a=1)
 
-class TestEnsureAttributes(object):
-    def test_leaves_attribute_alone(self):
+        report = init_trace_report()
+        totals = [entry[4] for entry in report]
+
+        assert sorted(totals, reverse=True) == totals
+        assert (C, "b", "factory") == report[0][:3]
+        assert 5 == report[0][3]
+        assert report[0][4] >= report[0][5] > 0
+        assert report[:1] == init_trace_report(limit=1)
+
+
+class TestPool(object):
+    def test_acquire_release(self):
+        """
+        Released objects are reused, new ones are only created if the pool is
+        empty.
+        """
+        p = Pool(list)
+        o1 = p.acquire()
+        p.release(o1)
+
+        assert 1 == len(p)
+        assert o1 is p.acquire()
+        assert o1 is not p.acquire()
+        assert 0 == len(p)
+
+    def test_bounded(self):
+        """
+        Objects that are released into a full pool are dropped.
+        """
+        p = Pool(list, size=1)
+        o1, o2 = p.acquire(), p.acquire()
+        p.release(o1)
+        p.release(o2)
+
+        assert 1 == len(p)
+        assert o1 is p.acquire()
+
+    def test_negative_size(self):
+        """
+        Raises ValueError on negative sizes.
+        """
+        with pytest.raises(ValueError) as e:
+            Pool(list, size=-1)
+        assert "size must not be negative." == e.value.args[0]
+
+    def test_reset(self):
+        """
+        The reset hook is called with every released object.
+        """
+        p = Pool(list, reset=lambda o: o.__delitem__(slice(None)))
+        o = p.acquire()
+        o.append(42)
+        p.release(o)
+
+        assert [] == p.acquire()
+
+    def test_thread_local(self):
+        """
+        Thread local pools don't share objects between threads.
+        """
+        p = Pool(list, thread_local=True)
+        p.release([42])
+        rv = []
+        t = threading.Thread(target=lambda: rv.append(p.acquire()))
+        t.start()
+        t.join()
+
+        assert [[]] == rv
+        assert [42] == p.acquire()
+
+    @pytest.mark.parametrize("thread_local", [False, True])
+    def test_concurrent(self, thread_local):
+        """
+        No object is handed out twice at the same time.
+        """
+        p = Pool(object, size=4, thread_local=thread_local)
+        in_use = set()
+        errors = []
+        lock = threading.Lock()
+
+        def work():
+            for _ in range(1000):
+                o = p.acquire()
+                with lock:
+                    if id(o) in in_use:
+                        errors.append(o)
+                    in_use.add(id(o))
+                with lock:
+                    in_use.discard(id(o))
+                p.release(o)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert [] == errors
+
+    def test_repr(self):
+        """
+        repr returns something sensible.
+        """
+        assert (
+            "<Pool(factory=<{0} 'list'>, size=2, reset=None, "
+            "thread_local=True)>".format("type" if PY2 else "class")
+        ) == repr(Pool(list, size=2, thread_local=True))
+
+    def test_default_pool(self):
+        """
+        Missing values are acquired from the pool, passed ones are used
+        as-is.
+        """
+        calls = []
+
+        def factory():
+            calls.append(None)
+            return []
+
+        p = Pool(factory)
+        idle = []
+        p.release(idle)
+
+        @with_init([Attribute("a", default_pool=p)])
+        class C(object):
+            pass
+
+        assert idle is C().a
+        assert 42 == C(a=42).a
+        assert [] == C().a
+        assert 1 == len(calls)
+
+    @pytest.mark.parametrize("storage", ["dict", "slots", "tuple"])
+    def test_release_pooled(self, storage):
+        """
+        release_pooled returns the values of pooled attributes to their
+        pools.
+        """
+        p = Pool(dict)
+
+        @attributes(["a", Attribute("b", default_pool=p)], storage=storage)
+        class C(object):
+            pass
+
+        c = C(a=1)
+        release_pooled(c)
+
+        assert 1 == len(p)
+        assert c.b is C(a=2).b
+
+    def test_release_pooled_undecorated(self):
+        """
+        Raises TypeError if the class hasn't been decorated by attributes.
+        """
+        with pytest.raises(TypeError):
+            release_pooled(object())
+
+    def test_traced(self):
+        """
+        Acquiring from the pool is a separate step in traced initializers.
+        """
+        @attributes([Attribute("a", default_pool=Pool(list))],
+                    trace_init=True)
+        class C(object):
+            pass
+
+        C()
+
+        assert ("a", "pool") in [
+            (name, step) for cl, name, step, _, _, _ in init_trace_report()
+            if cl is C
+        ]
+
+    @pytest.mark.skipif(not HAS_SIGNATURE, reason="Needs inspect.signature.")
+    def test_signature(self):
+        """
+        Pooled attributes are optional in the signature.
+        """
+        @attributes([Attribute("a", default_pool=Pool(list))])
+        class C(object):
+            pass
+
+        param = inspect.signature(C).parameters["a"]
+        assert NOTHING is param.default
+
+
+class TestAttributes(object):
+    def test_leaves_init_alone(self):
+        """
+        If *apply_with_init* or *create_init* is `False`, leave __init__ alone.
+        """
+        @attributes(["a"], apply_with_init=False)
+        class C(object):
+            pass
+
+        @attributes(["a"], create_init=False)
+        class CDeprecated(object):
+            pass
+
+        obj1 = C()
+        obj2 = CDeprecated()
+
+        with pytest.raises(AttributeError):
+            obj1.a
+        with pytest.raises(AttributeError):
+            obj2.a
+
+    def test_passes_cmp_options(self):
+        """
+        *eq*, *order*, and *hash* are passed to with_cmp.
+        """
+        @attributes(["a"], order=False, hash=False)
+        class C(object):
+            pass
+
+        assert C(a=1) == C(a=1)
+        assert None is C.__hash__
+        assert "__lt__" not in C.__dict__
+
+    def test_wraps_init(self):
+        """
+        If *create_init* is `True`, build initializer.
+        """
+        @attributes(["a", "b"], apply_with_init=True)
+        class C(object):
+            pass
+
+        obj = C(a=1, b=2)
+        assert 1 == obj.a
+        assert 2 == obj.b
+
+    def test_immutable(self):
+        """
+        If *apply_immutable* is `True`, make class immutable.
+        """
+        @attributes(["a"], apply_immutable=True)
+        class ImmuClass(object):
+            pass
+
+        obj = ImmuClass(a=42)
+        with pytest.raises(AttributeError):
+            obj.a = "23"
+
+    def test_apply_with_cmp(self):
+        """
+        Don't add cmp methods if *apply_with_cmp* is `False`.
+        """
+        @attributes(["a"], apply_with_cmp=False)
+        class C(object):
+            pass
+
+        obj = C(a=1)
+        if PY2:
+            assert None is getattr(obj, "__eq__", None)
+        else:
+            assert object.__eq__ == C.__eq__
+
+    def test_apply_with_repr(self):
+        """
+        Don't add __repr__ if *apply_with_repr* is `False`.
+        """
+        @attributes(["a"], apply_with_repr=False)
+        class C(object):
+            pass
+
+        assert repr(C(a=1)).startswith("<test_characteristic.")
+
+    def test_store_attributes(self):
+        """
+        store_attributes is called on the class to store the attributes that
+        were passed in.
+        """
+        attrs = [Attribute("a"), Attribute("b")]
+
+        @attributes(
+            attrs, store_attributes=lambda cls, a: setattr(cls, "foo", a)
+        )
+        class C(object):
+            pass
+
+        assert C.foo == attrs
+
+    def test_store_attributes_stores_Attributes(self):
+        """
+        The attributes passed to store_attributes are always instances of
+        Attribute, even if they were simple strings when provided.
+        """
+        @attributes(["a", "b"])
+        class C(object):
+            pass
+
+        assert C.characteristic_attributes == [Attribute("a"), Attribute("b")]
+
+    def test_store_attributes_defaults_to_characteristic_attributes(self):
+        """
+        By default, store_attributes stores the attributes in
+        `characteristic_attributes` on the class.
+        """
+        attrs = [Attribute("a")]
+
+        @attributes(attrs)
+        class C(object):
+            pass
+
+        assert C.characteristic_attributes == attrs
+
+    def test_private(self):
+        """
+        Integration test for name mangling/aliasing.
+        """
+        @attributes([Attribute("_a")])
+        class C(object):
+            pass
+        c = C(a=42)
+        assert 42 == c._a
+
+    def test_private_no_alias(self):
+        """
+        Integration test for name mangling/aliasing.
+        """
+        @attributes([Attribute("_a", init_aliaser=None)])
+        class C(object):
+            pass
+        c = C(_a=42)
+        assert 42 == c._a
+
+    def test_deprecation_create_init(self):
+        """
+        Emits a DeprecationWarning if `create_init` is used.
+        """
+        with warnings.catch_warnings(record=True) as w:
+            @attributes(["a"], create_init=False)
+            class C(object):
+                pass
+        assert (
+            '`create_init` has been deprecated in 14.0, please use '
+            '`apply_with_init`.'
+        ) == w[0].message.args[0]
+        assert issubclass(w[0].category, DeprecationWarning)
+
+    def test_deprecation_defaults(self):
+        """
+        Emits a DeprecationWarning if `defaults` is used.
+        """
+        with warnings.catch_warnings(record=True) as w:
+            @attributes(["a"], defaults={"a": 42})
+            class C(object):
+                pass
+        assert (
+            '`defaults` has been deprecated in 14.0, please use the '
+            '`Attribute` class instead.'
+        ) == w[0].message.args[0]
+        assert issubclass(w[0].category, DeprecationWarning)
+
+    def test_does_not_allow_extra_keyword_arguments(self):
+        """
+        Keyword arguments other than the ones consumed are still TypeErrors.
+        """
+        with pytest.raises(TypeError) as e:
+            @attributes(["a"], not_an_arg=12)
+            class C(object):
+                pass
+        assert e.value.args == (
+            "attributes() got an unexpected keyword argument 'not_an_arg'",
+        )
+
+    def test_no_attributes(self):
+        """
+        Specifying no attributes doesn't raise an exception.
+        """
+        @attributes([])
+        class C(object):
+            pass
+        C()
+
+    def test_unknown_storage(self):
+        """
+        Raises ValueError on unknown storages.
+        """
+        with pytest.raises(ValueError) as e:
+            attributes(["a"], storage="foo")
+        assert "Unknown storage 'foo'." == e.value.args[0]
+
+
+class TestInheritAttributes(object):
+    def test_merges(self):
+        """
+        inherit_attributes prepends the attributes of the decorated base.
+        """
+        @attributes(["a", Attribute("b", default_value=2)])
+        class C(object):
+            pass
+
+        @attributes(["c"], inherit_attributes=True)
+        class D(C):
+            pass
+
+        d = D(a=1, c=3)
+
+        assert (1, 2, 3) == (d.a, d.b, d.c)
+        assert "<D(a=1, b=2, c=3)>" == repr(d)
+        assert D(a=1, c=3) == d
+        assert ["a", "b", "c"] == [a.name for a in schema(D).attributes]
+        assert ["a", "b", "c"] == [
+            a.name for a in D.characteristic_attributes
+        ]
+
+    def test_override(self):
+        """
+        Attributes of the subclass replace inherited ones of the same name.
+        """
+        @attributes(["a", "b"])
+        class C(object):
+            pass
+
+        @attributes([Attribute("a", default_value=42), "c"],
+                    inherit_attributes=True)
+        class D(C):
+            pass
+
+        assert [Attribute("b"), Attribute("a", default_value=42),
+                Attribute("c")] == D.characteristic_attributes
+        assert 42 == D(b=1, c=2).a
+
+    def test_flat_init(self):
+        """
+        The initializer of the subclass calls the original initializer of the
+        base directly instead of the generated one, however deep the
+        hierarchy is.
+        """
+        calls = []
+
+        @attributes(["a"])
+        class C(object):
+            def __init__(self):
+                calls.append(self.a)
+
+        cl = C
+        for name in "bcdef":
+            cl = attributes([name], inherit_attributes=True)(
+                type(name.upper(), (cl,), {})
+            )
+
+        f = cl(a=1, b=2, c=3, d=4, e=5, f=6)
+
+        assert (1, 6) == (f.a, f.f)
+        assert [1] == calls
+        assert C.__dict__["__original_init__"] is cl.__original_init__
+
+    def test_redecorate_without_inheriting(self):
+        """
+        Re-decorating a subclass with all attributes doesn't recurse into the
+        initializer of the base.
+        """
+        @attributes(["a"])
+        class C(object):
+            pass
+
+        @attributes(["a", "b"])
+        class D(C):
+            pass
+
+        d = D(a=1, b=2)
+
+        assert (1, 2) == (d.a, d.b)
+
+    def test_no_decorated_base(self):
+        """
+        Without a decorated base only the own attributes are used.
+        """
+        @attributes(["a"], inherit_attributes=True)
+        class C(object):
+            pass
+
+        assert [Attribute("a")] == C.characteristic_attributes
+
+    def test_immutable(self):
+        """
+        Immutable subclasses don't chain immutability sentries and keep the
+        frozen initializer.
+        """
+        @attributes(["a"], apply_immutable=True)
+        class C(object):
+            pass
+
+        @attributes(["b"], apply_immutable=True, inherit_attributes=True)
+        class D(C):
+            pass
+
+        d = D(a=1, b=2)
+
+        assert object.__setattr__ is D.__original_setattr__
+        assert "object_setattr" in D.__init__.__code__.co_names
+        for name in "ab":
+            with pytest.raises(AttributeError):
+                setattr(d, name, 3)
+
+    def test_slots(self):
+        """
+        Slotted subclasses don't duplicate the slots of their bases.
+        """
+        @attributes(["a"], storage="slots")
+        class C(object):
+            pass
+
+        @attributes(["b"], storage="slots", inherit_attributes=True)
+        class D(C):
+            pass
+
+        d = D(a=1, b=2)
+
+        assert (1, 2) == (d.a, d.b)
+        assert ("b",) == D.__slots__
+        assert not hasattr(d, "__dict__")
+
+
+@attributes(["x", Attribute("y", default_value=0)], storage="slots")
+class SlotsPoint(object):
+    pass
+
+
+@attributes(["x", Attribute("y", default_value=0)], storage="slots",
+            apply_immutable=True)
+class FrozenSlotsPoint(object):
+    pass
+
+
+class SlotsOnDict(object):
+    pass
+
+
+@attributes(["x"], storage="slots")
+class SlotsPointOnDict(SlotsOnDict):
+    pass
+
+
+class TestSlots(object):
+    @pytest.mark.parametrize("cl", [SlotsPoint, FrozenSlotsPoint])
+    def test_pickle_and_copy(self, cl):
+        """
+        Instances can be pickled using all protocols and copied, even if
+        they are immutable.
+        """
+        import copy
+
+        p = cl(x=1, y=[2])
+        for q in [pickle.loads(pickle.dumps(p, protocol))
+                  for protocol in range(pickle.HIGHEST_PROTOCOL + 1)] + [
+                copy.copy(p), copy.deepcopy(p)]:
+            assert p == q
+            assert cl is q.__class__
+
+    def test_pickle_instance_dict(self):
+        """
+        Attributes that live in the instance dictionary of a base survive
+        pickling.
+        """
+        p = SlotsPointOnDict(x=1)
+        p.extra = 2
+
+        q = pickle.loads(pickle.dumps(p))
+
+        assert (1, 2) == (q.x, q.extra)
+
+    @pytest.mark.skipif(not HAS_WRITABLE_CELLS,
+                        reason="Needs writable closure cells.")
+    def test_zero_argument_super(self):
+        """
+        Zero-argument super() works in methods of slotted classes.
+        """
+        class Base(object):
+            def __init__(self):
+                self.initialized = True
+
+            def describe(self):
+                return "base"
+
+        @attributes(["a"], storage="slots", weakref_slot=False)
+        class S(Base):
+            def __init__(self):
+                super().__init__()
+
+            def describe(self):
+                return "s/" + super().describe()
+
+            @property
+            def described(self):
+                return super().describe()
+
+        s = S(a=1)
+
+        assert (1, True) == (s.a, s.initialized)
+        assert "s/base" == s.describe()
+        assert "base" == s.described
+
+    def test_slots(self):
+        """
+        storage="slots" stores attributes in __slots__ and keeps everything
+        else working.
+        """
+        @attributes(["a", Attribute("b", default_value=2)], storage="slots")
+        class C(object):
+            def method(self):
+                return self.a + self.b
+
+        c = C(a=1)
+        assert ("a", "b", "__weakref__") == C.__slots__
+        assert not hasattr(c, "__dict__")
+        assert 3 == c.method()
+        assert C(a=1) == c
+        assert "<C(a=1, b=2)>" == repr(c)
+        assert "C" == C.__name__
+        with pytest.raises(AttributeError):
+            c.c = 3
+
+    def test_weakref_slot(self):
+        """
+        Instances of slotted classes can be weakly referenced by default.
+        """
+        @attributes(["a"], storage="slots")
+        class C(object):
+            pass
+
+        c = C(a=1)
+        assert c is weakref.ref(c)()
+
+    def test_no_weakref_slot(self):
+        """
+        weakref_slot=False leaves out __weakref__.
+        """
+        @attributes(["a"], storage="slots", weakref_slot=False)
+        class C(object):
+            pass
+
+        assert ("a",) == C.__slots__
+        with pytest.raises(TypeError):
+            weakref.ref(C(a=1))
+
+    def test_weakref_slot_inherited(self):
+        """
+        __weakref__ isn't added again if a base class already has one.
+        """
+        class Base(object):
+            pass
+
+        @attributes(["a"], storage="slots")
+        class C(Base):
+            pass
+
+        c = C(a=1)
+        assert ("a",) == C.__slots__
+        assert c is weakref.ref(c)()
+
+    def test_track_instances_without_weakref_slot(self):
+        """
+        Instances without a weakref slot can't be tracked, unless a base
+        class makes them weakly referenceable.
+        """
+        with pytest.raises(ValueError) as e:
+            @attributes(["a"], storage="slots", weakref_slot=False,
+                        track_instances=True)
+            class C(object):
+                pass
+
+        assert (
+            "Instances of classes with slots storage can't be tracked "
+            "without a weakref slot." == e.value.args[0]
+        )
+
+        class Base(object):
+            pass
+
+        @attributes(["a"], storage="slots", weakref_slot=False,
+                    track_instances=True)
+        class D(Base):
+            pass
+
+        d = D(a=1)
+        assert 1 == instance_stats()[D]["alive"]
+        assert 1 == d.a
+
+    def test_immutable(self):
+        """
+        Slotted classes can be immutable.
+        """
+        @attributes(["a"], storage="slots", apply_immutable=True)
+        class C(object):
+            pass
+
+        c = C(a=1)
+        with pytest.raises(AttributeError):
+            c.a = 2
+
+
+@attributes(["id", Attribute("name", default_value=""),
+             Attribute("_tags", default_factory=frozenset, share_default=True),
+             Attribute("score", default_value=0, instance_of=int),
+             Attribute("notes", default_factory=list)],
+            storage="sparse")
+class Sparse(object):
+    pass
+
+
+class TestSparseStorage(object):
+    def test_defaults_not_stored(self):
+        """
+        Values that are identical to their defaults aren't stored in the
+        instance but read from the class.
+        """
+        s = Sparse(id=1)
+
+        assert {"id": 1, "notes": []} == s.__dict__
+        assert ("", frozenset(), 0) == (s.name, s._tags, s.score)
+        assert s._tags is Sparse._tags
+        assert "" == Sparse.name
+
+    def test_class_attribute_clash(self):
+        """
+        Raises ValueError instead of overwriting a class attribute with a
+        default.
+        """
+        with pytest.raises(ValueError) as e:
+            @attributes([Attribute("a", default_value=1)], storage="sparse")
+            class X(object):
+                a = "constant"
+
+        assert (
+            "Sparse storage can't store the default of 'a' on the class "
+            "because the class already has an attribute of that name."
+        ) == e.value.args[0]
+
+    def test_other_values_stored(self):
+        """
+        Values that aren't identical to the default are stored, even if they
+        are equal.
+        """
+        tags = frozenset()
+        s = Sparse(id=1, name="a", tags=tags, score=0)
+
+        assert {"id": 1, "name": "a", "_tags": tags, "notes": []} == (
+            s.__dict__
+        )
+        assert s._tags is tags
+
+    def test_cmp_repr_and_serialization(self):
+        """
+        Comparison, repr, and serialization see the defaults.
+        """
+        s = Sparse(id=1)
+
+        assert Sparse(id=1, name="", score=0, notes=[]) == s
+        assert (
+            "<Sparse(id=1, name='', _tags=frozenset(), score=0, notes=[])>"
+            == repr(s)
+        )
+        assert [s] == unpack(pack(Sparse, [s]))
+        f = io.StringIO()
+        dump_jsonl(Sparse, [Sparse(id=2, tags=None)], f)
+        f.seek(0)
+        assert [Sparse(id=2, tags=None)] == list(load_jsonl(Sparse, f))
+
+    def test_instance_of(self):
+        """
+        Passed values are still checked.
+        """
+        with pytest.raises(TypeError):
+            Sparse(id=1, score="0")
+
+    def test_immutable(self):
+        """
+        Sparse storage works with immutable classes.
+        """
+        @attributes(["a", Attribute("b", default_value=2)], storage="sparse",
+                    apply_immutable=True)
+        class C(object):
+            pass
+
+        c = C(a=1)
+
+        assert {"a": 1} == c.__dict__
+        assert 2 == c.b
+        with pytest.raises(AttributeError):
+            c.b = 3
+
+    def test_traced(self):
+        """
+        Traced initializers stay sparse.
+        """
+        @attributes(["a", Attribute("b", default_value=2)], storage="sparse",
+                    trace_init=True)
+        class C(object):
+            pass
+
+        assert {"a": 1} == C(a=1).__dict__
+        assert {"a": 1, "b": 3} == C(a=1, b=3).__dict__
+
+    def test_smaller(self):
+        """
+        Wide instances that mostly keep their defaults are a lot smaller.
+        """
+        attrs = ["id"] + [Attribute("f{0}".format(i), default_value=None)
+                          for i in range(80)]
+
+        @attributes(attrs, storage="sparse")
+        class S(object):
+            pass
+
+        @attributes(attrs)
+        class D(object):
+            pass
+
+        def size(obj):
+            return sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+
+        assert size(S(id=1, f3=4)) * 3 < size(D(id=1, f3=4))
+
+
+@attributes(["x", Attribute("_y", default_value=0, instance_of=int)],
+            storage="tuple")
+class TuplePoint(object):
+    def norm1(self):
+        return abs(self.x) + abs(self._y)
+
+
+class TestTupleStorage(object):
+    def test_tuple(self):
+        """
+        storage="tuple" creates tuple subclasses with read-only properties.
+        """
+        p = TuplePoint(x=1, y=-2)
+
+        assert isinstance(p, tuple)
+        assert (1, -2) == (p.x, p._y)
+        assert 3 == p.norm1()
+        assert "<TuplePoint(x=1, _y=-2)>" == repr(p)
+        assert not hasattr(p, "__dict__")
+        assert [Attribute("x"), Attribute("_y", default_value=0,
+                                          instance_of=int)] == (
+            TuplePoint.characteristic_attributes
+        )
+
+    def test_initializer(self):
+        """
+        The generated constructor honors defaults, factories, and type
+        checks and rejects unknown and positional arguments.
+        """
+        @attributes(["a", Attribute("b", default_factory=list),
+                     Attribute("c", instance_of=int)], storage="tuple")
+        class C(object):
+            pass
+
+        assert (1, [], 3) == C(a=1, c=3)
+        with pytest.raises(ValueError) as e:
+            C(c=3)
+        assert "Missing keyword value for 'a'." == e.value.args[0]
+        with pytest.raises(TypeError):
+            C(a=1, c="3")
+        with pytest.raises(TypeError) as e:
+            C(a=1, c=3, d=4)
+        assert (
+            "C() got an unexpected keyword argument 'd'"
+        ) == e.value.args[0]
+        with pytest.raises(TypeError):
+            C(1, 2, 3)
+
+    def test_immutable(self):
+        """
+        Attributes can't be set and instances can't grow new ones.
+        """
+        p = TuplePoint(x=1)
+
+        with pytest.raises(AttributeError):
+            p.x = 2
+        with pytest.raises(AttributeError):
+            p.z = 2
+
+    def test_native_cmp_and_hash(self):
+        """
+        Instances compare and hash like tuples of their values.
+        """
+        assert TuplePoint(x=1) == TuplePoint(x=1)
+        assert TuplePoint(x=1) < TuplePoint(x=1, y=1)
+        assert hash((1, 0)) == hash(TuplePoint(x=1))
+        assert "__eq__" not in TuplePoint.__dict__
+
+    def test_exclude_from_cmp(self):
+        """
+        If attributes are excluded from comparison, with_cmp is applied.
+        """
+        @attributes(["a", Attribute("b", exclude_from_cmp=True)],
+                    storage="tuple")
+        class C(object):
+            pass
+
+        assert C(a=1, b=2) == C(a=1, b=3)
+        assert hash(C(a=1, b=2)) == hash(C(a=1, b=3))
+
+    def test_pickle_and_copy(self):
+        """
+        Instances can be pickled and copied.
+        """
+        import copy
+        p = TuplePoint(x=1, y=2)
+
+        for q in [pickle.loads(pickle.dumps(p, protocol))
+                  for protocol in range(pickle.HIGHEST_PROTOCOL + 1)] + [
+                copy.copy(p), copy.deepcopy(p)]:
+            assert p == q
+            assert TuplePoint is q.__class__
+
+    def test_pack(self):
+        """
+        Tuple based classes work with pack() and unpack().
+        """
+        ps = [TuplePoint(x=1), TuplePoint(x=2, y=3)]
+
+        assert ps == unpack(pack(TuplePoint, ps))
+
+    def test_inherit_attributes(self):
+        """
+        Tuple based classes can inherit attributes of tuple based classes.
+        """
+        @attributes(["z"], storage="tuple", inherit_attributes=True)
+        class Point3D(TuplePoint):
+            pass
+
+        p = Point3D(x=1, y=2, z=3)
+
+        assert (1, 2, 3) == p
+        assert 3 == p.z
+        assert 3 == p.norm1()
+
+    @pytest.mark.parametrize("option", ["eq", "order", "hash"])
+    def test_cmp_options_rejected(self, option):
+        """
+        Tuples always compare, order, and hash natively.
+        """
+        with pytest.raises(ValueError) as e:
+            attributes(["a"], storage="tuple", **{option: False})
+
+        assert (
+            "Instances of classes with tuple storage always compare, order, "
+            "and hash like tuples."
+        ) == e.value.args[0]
+
+    def test_init_rejected(self):
+        """
+        Classes with an __init__ can't have tuple storage.
+        """
+        with pytest.raises(ValueError) as e:
+            @attributes(["a"], storage="tuple")
+            class C(object):
+                def __init__(self):
+                    pass
+
+        assert (
+            "Classes with tuple storage can't have an __init__."
+        ) == e.value.args[0]
+
+    @pytest.mark.skipif(not HAS_WRITABLE_CELLS,
+                        reason="Needs writable closure cells.")
+    def test_zero_argument_super(self):
+        """
+        Zero-argument super() works in methods of classes with tuple storage.
+        """
+        @attributes(["a"], storage="tuple")
+        class T(object):
+            def __len__(self):
+                return super().__len__() * 10
+
+        assert 10 == len(T(a=1))
+
+    def test_inherited_init_rejected(self):
+        """
+        Classes with tuple storage can't inherit an __init__ either, like the
+        generated one of a base with another storage.
+        """
+        @attributes(["a"])
+        class B(object):
+            pass
+
+        with pytest.raises(ValueError) as e:
+            @attributes(["b"], storage="tuple", inherit_attributes=True)
+            class T(B):
+                pass
+
+        assert (
+            "Classes with tuple storage can't inherit an __init__."
+        ) == e.value.args[0]
+
+    def test_exclude_from_init_rejected(self):
+        """
+        Attributes can't be excluded from the initializer.
+        """
+        with pytest.raises(ValueError):
+            @attributes([Attribute("a", exclude_from_init=True)],
+                        storage="tuple")
+            class C(object):
+                pass
+
+    def test_track_instances_rejected(self):
+        """
+        Tuples can't be weakly referenced, so they can't be tracked.
+        """
+        with pytest.raises(ValueError):
+            attributes(["a"], storage="tuple", track_instances=True)
+
+
+class TestEnsureAttributes(object):
+    def test_leaves_attribute_alone(self):
+        """
+        List items that are an Attribute stay an Attribute.
+        """
+        a = Attribute("a")
+        assert a is _ensure_attributes([a], {})[0]
+
+    def test_converts_rest(self):
+        """
+        Any other item will be transformed into an Attribute.
+        """
+        l = _ensure_attributes(["a"], {})
+        assert isinstance(l[0], Attribute)
+        assert "a" == l[0].name
+
+    def test_defaults(self):
+        """
+        Legacy defaults are translated into default_value attributes.
+        """
+        l = _ensure_attributes(["a"], {"a": 42})
+        assert 42 == l[0].default_value
+
+    def test_defaults_Attribute(self):
+        """
+        Raises ValueError on defaults != {} and an Attribute within attrs.
+        """
+        with pytest.raises(ValueError):
+            _ensure_attributes([Attribute("a")], defaults={"a": 42})
+
+
+class TestImmutable(object):
+    def test_bare(self):
+        """
+        In an immutable class, setting an definition-time attribute raises an
+        AttributeError.
+        """
+        @immutable(["foo"])
+        class ImmuClass(object):
+            foo = "bar"
+
+        i = ImmuClass()
+        with pytest.raises(AttributeError):
+            i.foo = "not bar"
+
+    def test_Attribute(self):
+        """
+        Mutation is caught if user passes an Attribute instance.
+        """
+        @immutable([Attribute("foo")])
+        class ImmuClass(object):
+            def __init__(self):
+                self.foo = "bar"
+
+        i = ImmuClass()
+        with pytest.raises(AttributeError):
+            i.foo = "not bar"
+
+    def test_shared_sentry(self):
+        """
+        All immutable classes share the same sentry that checks the names of
+        their own attributes.
+        """
+        @immutable(["a"])
+        class A(object):
+            pass
+
+        @immutable(["b"])
+        class B(A):
+            pass
+
+        a, b = A(), B()
+        a.b = 1
+
+        assert A.__setattr__ is B.__setattr__
+        assert ("a",) == A.__characteristic_immutable__
+        with pytest.raises(AttributeError):
+            a.a = 2
+        with pytest.raises(AttributeError):
+            b.b = 2
+
+    def test_subclass_keeps_base_attributes(self, monkeypatch):
+        """
+        Attributes that are immutable in a base stay immutable if a subclass
+        is decorated again.
+        """
+        for pypy in (False, True):
+            monkeypatch.setattr("characteristic.PYPY", pypy)
+
+            @immutable(["a"])
+            class P(object):
+                a = 1
+
+            @immutable(["b"])
+            class Q(P):
+                b = 2
+
+            @attributes(["b"], apply_immutable=True)
+            class R(P):
+                pass
+
+            assert ("b", "a") == Q.__characteristic_immutable__
+            for obj in (Q(), R(b=2)):
+                with pytest.raises(AttributeError):
+                    obj.a = 3
+                with pytest.raises(AttributeError):
+                    obj.b = 3
+
+    def test_init(self):
+        """
+        Changes within __init__ are allowed.
+        """
+        @immutable(["foo"])
+        class ImmuClass(object):
+            def __init__(self):
+                self.foo = "bar"
+
+        i = ImmuClass()
+        assert "bar" == i.foo
+
+    def test_with_init(self):
+        """
+        Changes in with_init's initializer are allowed.
+        """
+        @immutable(["foo"])
+        @with_init(["foo"])
+        class ImmuClass(object):
+            pass
+
+        i = ImmuClass(foo="qux")
+        assert "qux" == i.foo
+
+    def test_Attribute_exclude_from_immutable(self):
+        """
+        Ignores attribute if exclude_from_immutable=True.
+        """
+        @immutable([Attribute("a", exclude_from_immutable=True), "b"])
+        class C(object):
+            def __init__(self, a, b):
+                self.a = a
+                self.b = b
+
+        c = C(1, 2)
+        c.a = 3
+        with pytest.raises(AttributeError):
+            c.b = 4
+
+    @pytest.mark.parametrize("storage", ["dict", "slots"])
+    def test_frozen_init_bypasses_sentry(self, storage):
+        """
+        Initializers of immutable classes set the attributes directly and the
+        instances stay immutable.
+        """
+        @attributes([Attribute("a", instance_of=int),
+                     Attribute("b", default_factory=list), "c"],
+                    apply_immutable=True, storage=storage)
+        class C(object):
+            pass
+
+        c = C(a=1, c=3)
+
+        assert (1, [], 3) == (c.a, c.b, c.c)
+        assert "object_setattr" in C.__init__.__code__.co_names
+        with pytest.raises(AttributeError):
+            c.a = 2
+        with pytest.raises(ValueError):
+            C(a=1)
+        with pytest.raises(TypeError):
+            C(a="1", c=3)
+
+    def test_frozen_init_custom_setattr(self):
+        """
+        Classes with their own __setattr__ keep using it.
+        """
+        calls = []
+
+        @attributes(["a"], apply_immutable=True)
+        class C(object):
+            def __setattr__(self, name, value):
+                calls.append(name)
+                object.__setattr__(self, name, value)
+
+        assert 1 == C(a=1).a
+        assert ["a"] == calls
+        assert "object_setattr" not in C.__init__.__code__.co_names
+
+    def test_frozen_init_subclass_setattr(self):
+        """
+        Subclasses that override __setattr__ make the initializer use it.
+        """
+        calls = []
+
+        @attributes(["a"], apply_immutable=True)
+        class C(object):
+            pass
+
+        class D(C):
+            def __setattr__(self, name, value):
+                calls.append(name)
+                object.__setattr__(self, name, value)
+
+        assert 1 == D(a=1).a
+        assert ["a"] == calls
+
+    def test_frozen_init_immutable_subclass_setattr(self):
+        """
+        Immutable subclasses that override __setattr__ make the initializer
+        use it although their __setattr__ is the sentry again.
+        """
+        calls = []
+
+        @attributes(["a"], apply_immutable=True)
+        class Base(object):
+            pass
+
+        @immutable(["b"])
+        class Sub(Base):
+            def __setattr__(self, name, value):
+                calls.append(name)
+                object.__setattr__(self, name, value)
+
+        assert 1 == Sub(a=1).a
+        assert ["a"] == calls
+        assert 1 == Base(a=1).a
+        assert ["a"] == calls
+
+
+@pytest.fixture
+def pypy(monkeypatch):
+    """
+    Make characteristic generate the code it would generate on PyPy.
+    """
+    import characteristic
+    monkeypatch.setattr(characteristic, "PYPY", True)
+
+
+@pytest.mark.usefixtures("pypy")
+class TestPyPyVariants(object):
+    def test_immutable(self):
+        """
+        Attributes can be set from __init__ but not afterwards, without
+        inspecting frames.
+        """
+        @immutable(["a", Attribute("b", exclude_from_immutable=True)])
+        class C(object):
+            def __init__(self):
+                self.a = 1
+                self.set_b()
+
+            def set_b(self):
+                self.b = 2
+
+        def getframe(*args):
+            raise AssertionError("Frame inspected.")
+
+        original_getframe = sys._getframe
+        sys._getframe = getframe
+        try:
+            c = C()
+        finally:
+            sys._getframe = original_getframe
+        c.b = 3
+
+        assert (1, 3) == (c.a, c.b)
+        with pytest.raises(AttributeError) as e:
+            c.a = 2
+        assert "Attribute 'a' of class 'C' is immutable." == e.value.args[0]
+
+    def test_immutable_nested_init(self):
+        """
+        Nested initializers of the same instance don't end the
+        initialization early.
+        """
+        @immutable(["a", "b"])
+        class C(object):
+            def __init__(self):
+                self.a = 1
+
+        @immutable(["a", "b"])
+        class D(C):
+            def __init__(self):
+                C.__init__(self)
+                self.b = 2
+
+        d = D()
+
+        assert (1, 2) == (d.a, d.b)
+        with pytest.raises(AttributeError):
+            d.b = 3
+
+    def test_immutable_subclass_init(self):
+        """
+        The __init__ of an undecorated subclass can set immutable attributes
+        before calling the one of its base.
+        """
+        @attributes(["a", "b"], apply_immutable=True)
+        class C(object):
+            pass
+
+        class D(C):
+            def __init__(self):
+                self.c = 3
+                self.a = 0
+                super(D, self).__init__(a=1, b=2)
+
+        d = D()
+
+        assert (1, 2, 3) == (d.a, d.b, d.c)
+        with pytest.raises(AttributeError):
+            d.a = 2
+
+    def test_immutable_failing_init(self):
+        """
+        Instances whose initializer failed aren't kept as initializing.
+        """
+        @immutable(["a"])
+        class C(object):
+            def __init__(self, fail):
+                self.a = 1
+                if fail:
+                    raise ValueError()
+
+        with pytest.raises(ValueError):
+            C(True)
+        c = C(False)
+        with pytest.raises(AttributeError):
+            c.a = 2
+
+    def test_attributes(self):
+        """
+        attributes() with immutability works and uses the frozen initializer.
+        """
+        @attributes(["a", Attribute("b", default_value=2)],
+                    apply_immutable=True)
+        class C(object):
+            pass
+
+        c = C(a=1)
+
+        assert (1, 2) == (c.a, c.b)
+        assert "object_setattr" in C.__init__.__code__.co_names
+        with pytest.raises(AttributeError):
+            c.a = 2
+
+    @pytest.mark.parametrize("trace_init", [False, True])
+    def test_attributes_custom_setattr(self, trace_init):
+        """
+        Generated initializers of immutable classes with their own
+        __setattr__ can set the attributes although they don't get the
+        frozen initializer.
+        """
+        @attributes(["a", Attribute("b", default_value=2)],
+                    apply_immutable=True, trace_init=trace_init)
+        class C(object):
+            def __setattr__(self, name, value):
+                object.__setattr__(self, name, value)
+
+        c = C(a=1)
+
+        assert (1, 2) == (c.a, c.b)
+        assert {} == characteristic._INITIALIZING
+        with pytest.raises(AttributeError):
+            c.a = 2
+
+    def test_eq(self):
+        """
+        The straight-line equality behaves like comparing tuples.
+        """
+        @with_cmp(["a", "b"])
+        class C(object):
+            def __init__(self, a, b):
+                self.a = a
+                self.b = b
+
+        nan = float("nan")
+
+        assert "characteristic_eq" == C.__eq__.__name__
+        assert C(1, nan) == C(1, nan)
+        assert C(1, 2) != C(1, 3)
+        assert C(1, 2) != C(2, 2)
+        assert not C(1, float("nan")) == C(1, float("nan"))
+        assert NotImplemented is C(1, 2).__eq__(object())
+        assert (
+            (C(1, 2) == C(1, 2), C(1, 2) != C(1, 2))
+            == ((1, 2) == (1, 2), (1, 2) != (1, 2))
+        )
+
+
+@attributes(["street", "city"])
+class Address(object):
+    pass
+
+
+@attributes(["name", "address", Attribute("tags", default_factory=list),
+             Attribute("seen", default_value=0, exclude_from_cmp=True)])
+class Person(object):
+    pass
+
+
+class TestSchema(object):
+    def test_indexes(self):
+        """
+        The schema precomputes the lookup tables of the attributes.
+        """
+        a = Attribute("a", instance_of=int)
+        b = Attribute("_b", default_value=42)
+        c = Attribute("c", default_factory=list, exclude_from_cmp=True)
+        d = Attribute("d", instance_of=str, exclude_from_init=True)
+
+        @attributes([a, b, c, d])
+        class C(object):
+            pass
+
+        s = schema(C)
+
+        assert (a, b, c, d) == s.attributes
+        assert (a, b, c) == s.init_attributes
+        assert (a, b, d) == s.cmp_attributes
+        assert {"a": a, "_b": b, "c": c, "d": d} == s.by_name
+        assert {"a": a, "b": b, "c": c} == s.by_kw_name
+        assert {"b": 42} == s.defaults
+        assert (2,) == s.factory_positions
+        assert (0,) == s.instance_of_positions
+        assert "<Schema(a, _b, c, d)>" == repr(s)
+
+    def test_registered_independently_of_store_attributes(self):
+        """
+        attributes() registers the schema even if the attributes aren't
+        stored on the class.
+        """
+        @attributes(["a"], store_attributes=lambda cl, attrs: None)
+        class C(object):
+            pass
+
+        assert not hasattr(C, "characteristic_attributes")
+        assert (Attribute("a"),) == schema(C).attributes
+
+    def test_cached(self):
+        """
+        Looking up a schema twice returns the same object.
+        """
+        @attributes(["a"])
+        class C(object):
+            pass
+
+        assert schema(C) is schema(C)
+
+    def test_subclass(self):
+        """
+        Subclasses share the schema of their decorated base.
+        """
+        @attributes(["a"], store_attributes=lambda cl, attrs: None)
+        class C(object):
+            pass
+
+        class D(C):
+            pass
+
+        assert schema(C) is schema(D)
+
+    def test_characteristic_attributes(self):
+        """
+        Classes that only have characteristic_attributes get a schema built
+        from them.
+        """
+        class C(object):
+            characteristic_attributes = [Attribute("a")]
+
+        assert isinstance(schema(C), Schema)
+        assert (Attribute("a"),) == schema(C).attributes
+
+    def test_undecorated(self):
+        """
+        Raises TypeError for classes that haven't been decorated.
+        """
+        class C(object):
+            pass
+
+        with pytest.raises(TypeError) as e:
+            schema(C)
+
+        assert (
+            "'C' is not a class decorated by attributes()."
+        ) == e.value.args[0]
+
+    def test_undecorated_cached(self):
+        """
+        Misses are cached but decorating the class afterwards registers it
+        nevertheless.
+        """
+        class C(object):
+            pass
+
+        for _ in range(2):
+            with pytest.raises(TypeError):
+                schema(C)
+        assert C in characteristic._SCHEMAS
+
+        attributes(["a"])(C)
+
+        assert (Attribute("a"),) == schema(C).attributes
+
+    def test_weak(self):
+        """
+        The registry doesn't keep classes alive.
+        """
+        @attributes(["a"])
+        class C(object):
+            pass
+
+        r = weakref.ref(C)
+        del C
+        gc.collect()
+
+        assert r() is None
+
+
+class TestDiff(object):
+    def test_equal(self):
+        """
+        Equal instances have no differences.
+        """
+        a = Person(name="a", address=Address(street="s", city="c"))
+        b = Person(name="a", address=Address(street="s", city="c"))
+        assert {} == diff(a, b)
+
+    def test_changed(self):
+        """
+        Changed attributes are returned with their old and new values.
+        """
+        a = Person(name="a", address=None)
+        b = Person(name="b", address=None)
+        assert {"name": ("a", "b")} == diff(a, b)
+
+    def test_nested(self):
+        """
+        Instances of decorated classes are diffed recursively.
+        """
+        a = Person(name="a", address=Address(street="s1", city="c"))
+        b = Person(name="a", address=Address(street="s2", city="c"))
+        assert {"address.street": ("s1", "s2")} == diff(a, b)
+
+    def test_sequences(self):
+        """
+        Sequences of the same length are diffed item by item, others as a
+        whole.
+        """
+        a = Person(name="a", address=None,
+                   tags=["x", Address(street="s", city="c1")])
+        b = Person(name="a", address=None,
+                   tags=["y", Address(street="s", city="c2")])
+        c = Person(name="a", address=None, tags=["x"])
+        assert {
+            "tags[0]": ("x", "y"),
+            "tags[1].city": ("c1", "c2"),
+        } == diff(a, b)
+        assert {"tags": (a.tags, ["x"])} == diff(a, c)
+
+    def test_different_nested_classes(self):
+        """
+        Values of different classes are reported as a whole.
+        """
+        addr = Address(street="s", city="c")
+        a = Person(name="a", address=addr)
+        b = Person(name="a", address="s, c")
+        assert {"address": (addr, "s, c")} == diff(a, b)
+
+    def test_exclude_from_cmp(self):
+        """
+        Attributes that are excluded from with_cmp are ignored.
+        """
+        a = Person(name="a", address=None, seen=1)
+        b = Person(name="a", address=None, seen=2)
+        assert {} == diff(a, b)
+
+    def test_different_classes(self):
+        """
+        Raises TypeError if the instances have different classes.
+        """
+        with pytest.raises(TypeError) as e:
+            diff(Person(name="a", address=None), Address(street="s", city="c"))
+        assert (
+            "Can't diff instances of different classes 'Person' and "
+            "'Address'." == e.value.args[0]
+        )
+
+    def test_scalar_subclasses(self):
         """
-        List items that are an Attribute stay an Attribute.
+        Values of subclasses of scalar types and values of different scalar
+        types are compared using ==.
         """
-        a = Attribute("a")
-        assert a is _ensure_attributes([a], {})[0]
+        class Int(int):
+            pass
 
-    def test_converts_rest(self):
+        a = Person(name=Int(1), address=1)
+        b = Person(name=Int(2), address=1.0)
+        assert {"name": (1, 2)} == diff(a, b)
+
+    def test_shared_differ(self):
         """
-        Any other item will be transformed into an Attribute.
+        Classes with the same attribute names share their differ.
         """
-        l = _ensure_attributes(["a"], {})
-        assert isinstance(l[0], Attribute)
-        assert "a" == l[0].name
+        @attributes(["street", "city"])
+        class OtherAddress(object):
+            pass
 
-    def test_defaults(self):
+        diff(Address(street="s", city="c"), Address(street="s", city="c"))
+        diff(OtherAddress(street="s", city="c"),
+             OtherAddress(street="s", city="c"))
+        assert (
+            schema(Address)._differ is schema(OtherAddress)._differ
+            is not None
+        )
+
+    def test_no_cmp_attributes(self):
         """
-        Legacy defaults are translated into default_value attributes.
+        Instances without attributes to compare have no differences.
         """
-        l = _ensure_attributes(["a"], {"a": 42})
-        assert 42 == l[0].default_value
+        @attributes([Attribute("a", exclude_from_cmp=True)])
+        class C(object):
+            pass
 
-    def test_defaults_Attribute(self):
+        assert {} == diff(C(a=1), C(a=2))
+
+    def test_not_decorated(self):
         """
-        Raises ValueError on defaults != {} and an Attribute within attrs.
+        Raises TypeError if the class hasn't been decorated by attributes().
+        """
+        class C(object):
+            pass
+        with pytest.raises(TypeError) as e:
+            diff(C(), C())
+        assert (
+            "'C' is not a class decorated by attributes()." == e.value.args[0]
+        )
+
+
+@attributes(["name", Attribute("children", default_factory=list),
+             Attribute("parent", default_value=None, exclude_from_cmp=True),
+             Attribute("link", default_value=None)])
+class Node(object):
+    pass
+
+
+def make_tree(leaf_name):
+    """
+    Return a tree whose nodes refer to their parents and whose leaf refers
+    back to the root.
+    """
+    root = Node(name="root")
+    child = Node(name="child", parent=root)
+    leaf = Node(name=leaf_name, parent=child, link=root)
+    root.children.append(child)
+    child.children.append(leaf)
+    return root
+
+
+class TestDeepEq(object):
+    def test_equal(self):
+        """
+        Equal graphs are equal.
+        """
+        assert deep_eq(make_tree("leaf"), make_tree("leaf"))
+
+    def test_unequal(self):
+        """
+        A difference deep down is found.
+        """
+        assert not deep_eq(make_tree("leaf"), make_tree("other leaf"))
+
+    def test_cycle(self):
+        """
+        Cycles terminate.
+        """
+        a = Node(name="a")
+        a.link = a
+        b = Node(name="a")
+        b.link = b
+        c = Node(name="c")
+        c.link = c
+        assert deep_eq(a, b)
+        assert not deep_eq(a, c)
+
+    def test_scalars(self):
+        """
+        Scalar attributes are compared using ==, also across types.
+        """
+        assert deep_eq(Node(name=1), Node(name=1.0))
+        assert not deep_eq(Node(name=1), Node(name=2))
+        assert not deep_eq(Node(name="a"), Node(name=b"a"))
+
+    def test_no_cmp_attributes(self):
+        """
+        Instances without attributes to compare are equal.
+        """
+        @attributes([Attribute("a", exclude_from_cmp=True)])
+        class C(object):
+            pass
+
+        assert deep_eq(C(a=1), C(a=2))
+
+    @pytest.mark.parametrize("a,b,result", [
+        ([1, 2], [1, 2], True),
+        ([1, 2], [1, 2, 3], False),
+        ((1, [2]), (1, [3]), False),
+        ({"a": [1]}, {"a": [1]}, True),
+        ({"a": 1}, {"b": 1}, False),
+        ({"a": 1}, {"a": 1, "b": 1}, False),
+        (1, 1.0, True),
+        (Node(name="a"), "a", False),
+    ])
+    def test_values(self, a, b, result):
+        """
+        Containers are compared item by item and anything else by ==.
+        """
+        assert result is deep_eq(a, b)
+
+
+@attributes([Attribute("a", instance_of=int),
+             Attribute("_b", instance_of=str),
+             Attribute("c")])
+class Typed(object):
+    pass
+
+
+class TestValidateColumns(object):
+    def test_valid(self):
         """
+        Returns an empty list if all values are valid.
+        """
+        assert [] == validate_columns(
+            Typed, {"a": [1, 2], "b": ["x", "y"], "c": [None, 1.0]}
+        )
+
+    def test_failures(self):
+        """
+        Reports all failing rows ordered by row index and attribute order
+        using the attribute names.
+        """
+        assert [
+            (0, "_b"), (1, "a"), (1, "_b"), (2, "a"),
+        ] == validate_columns(
+            Typed, {"a": [1, "2", None], "b": [2, 3.0, "z"]}
+        )
+
+    def test_missing_columns(self):
+        """
+        Columns that aren't passed are ignored.
+        """
+        assert [(0, "a")] == validate_columns(Typed, {"a": ["1"]})
+
+    def test_exclude_from_init(self):
+        """
+        Attributes that are excluded from with_init aren't checked.
+        """
+        @attributes([Attribute("a", instance_of=int,
+                               exclude_from_init=True)])
+        class C(object):
+            pass
+
+        assert [] == validate_columns(C, {"a": ["1"]})
+
+
+def run_async(awaitable):
+    """
+    Run *awaitable* to completion on a fresh event loop.
+    """
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        loop.close()
+
+
+def async_value(value):
+    """
+    Return an async default factory that returns *value*.
+    """
+    import asyncio
+    return lambda: asyncio.sleep(0, result=value)
+
+
+@pytest.mark.skipif(not HAS_ASYNC, reason="Needs native coroutines.")
+class TestAsync(object):
+    def test_ambiguous_defaults(self):
+        """
+        Passing async_default_factory together with any other default raises
+        ValueError.
+        """
+        for kw in [{"default_value": 1}, {"default_factory": list}]:
+            with pytest.raises(ValueError):
+                Attribute("a", async_default_factory=list, **kw)
+
+    def test_source(self):
+        """
+        The coroutine functions have their own file name whose source is in
+        the linecache so tracebacks and PDB show the right lines.
+        """
+        from characteristic import acreate
+
+        code = acreate.__code__
+        line = linecache.getline(code.co_filename, code.co_firstlineno)
+
+        assert "<characteristic async>" == code.co_filename
+        assert line.startswith("async def acreate(")
+
+    def test_sync_init_mandatory(self):
+        """
+        The regular initializer treats attributes with an
+        async_default_factory as mandatory.
+        """
+        @attributes([Attribute("a", async_default_factory=async_value(1))])
+        class C(object):
+            pass
+
         with pytest.raises(ValueError):
-            _ensure_attributes([Attribute("a")], defaults={"a": 42})
+            C()
+        assert 2 == C(a=2).a
 
+    def test_acreate(self):
+        """
+        acreate awaits missing defaults and leaves passed values alone.
+        """
+        from characteristic import acreate
 
-class TestImmutable(object):
-    def test_bare(self):
+        @attributes(["a",
+                     Attribute("_b", async_default_factory=async_value(2)),
+                     Attribute("c", async_default_factory=async_value(3))])
+        class C(object):
+            pass
+
+        assert C(a=1, b=2, c=4) == run_async(acreate(C, a=1, c=4))
+
+    def test_acreate_many(self):
         """
-        In an immutable class, setting an definition-time attribute raises an
-        AttributeError.
+        acreate_many awaits the missing defaults of all rows and doesn't
+        modify the rows.
         """
-        @immutable(["foo"])
-        class ImmuClass(object):
-            foo = "bar"
+        from characteristic import acreate_many
+        counter = iter(range(10))
 
-        i = ImmuClass()
-        with pytest.raises(AttributeError):
-            i.foo = "not bar"
+        @attributes(["a", Attribute("b", async_default_factory=lambda:
+                                    async_value(next(counter))())])
+        class C(object):
+            pass
 
-    def test_Attribute(self):
+        rows = [{"a": 1}, {"a": 2, "b": 42}, {"a": 3}]
+        assert [
+            C(a=1, b=0), C(a=2, b=42), C(a=3, b=1),
+        ] == run_async(acreate_many(C, rows))
+        assert {"a": 1} == rows[0]
+
+
+@attributes(["a", Attribute("_b", default_value=2),
+             Attribute("c", exclude_from_init=True)])
+class Packable(object):
+    c = None
+
+
+class TestPack(object):
+    def test_roundtrip(self):
         """
-        Mutation is caught if user passes an Attribute instance.
+        Packed instances survive pickling and are unpacked into equal
+        instances.
         """
-        @immutable([Attribute("foo")])
-        class ImmuClass(object):
-            def __init__(self):
-                self.foo = "bar"
+        objs = [Packable(a=1), Packable(a=2, b=3)]
+        packed = pickle.dumps(pack(Packable, objs))
+        assert objs == unpack(pickle.loads(packed))
 
-        i = ImmuClass()
+    def test_layout(self):
+        """
+        Keyword argument names are stored once and values positionally.
+        Attributes that are excluded from with_init are left out.
+        """
+        assert (
+            (Packable, ("a", "b"), [(1, 2), (3, 4)])
+            == pack(Packable, [Packable(a=1), Packable(a=3, b=4)])
+        )
+
+    def test_empty(self):
+        """
+        Empty batches work.
+        """
+        assert [] == unpack(pack(Packable, []))
+
+    def test_keyword_kw_name(self, tmpdir):
+        """
+        Keyword argument names that are Python keywords work when unpacking
+        and reading records.
+        """
+        @attributes([Attribute("_from", instance_of=int), "to"])
+        class Mail(object):
+            pass
+
+        objs = [Mail(**{"from": 1, "to": 2})]
+
+        assert objs == unpack(pack(Mail, objs))
+
+        @attributes([Attribute("_from", instance_of=int)])
+        class Record(object):
+            pass
+
+        path = str(tmpdir.join("records"))
+        with open(path, "wb") as f:
+            write_records(Record, [Record(**{"from": 1})], f)
+        with open(path, "rb") as f:
+            with MappedRecords(Record, f) as records:
+                assert [Record(**{"from": 1})] == list(records)
+
+    def test_schema_mismatch(self):
+        """
+        Raises ValueError if the keyword argument names don't match.
+        """
+        with pytest.raises(ValueError) as e:
+            unpack((Packable, ("a",), [(1,)]))
+        assert (
+            "Packed attributes ('a',) don't match the attributes of "
+            "'Packable'." == e.value.args[0]
+        )
+
+
+class TestEvolveMany(object):
+    @pytest.mark.parametrize("storage", ["dict", "slots", "tuple"])
+    def test_evolve(self, storage):
+        """
+        The passed attributes are changed, all others are shared with the
+        originals, which stay untouched.
+        """
+        @attributes([Attribute("_a", instance_of=int),
+                     Attribute("b", default_factory=list), "c"],
+                    storage=storage, apply_immutable=True)
+        class C(object):
+            pass
+
+        objs = [C(a=1, c=1), C(a=2, c=2)]
+        new = evolve_many(objs, a=3, c=4)
+
+        assert [C(a=3, b=[], c=4)] * 2 == new
+        assert all(n.b is o.b for n, o in zip(new, objs))
+        assert [C(a=1, c=1), C(a=2, c=2)] == objs
         with pytest.raises(AttributeError):
-            i.foo = "not bar"
+            new[0].c = 5
 
-    def test_init(self):
+    def test_no_init(self):
         """
-        Changes within __init__ are allowed.
+        Neither the initializer nor default factories are called and the
+        rest of the instance dictionary is copied.
         """
-        @immutable(["foo"])
-        class ImmuClass(object):
+        calls = []
+
+        @attributes(["a", Attribute("b", default_factory=lambda: calls)])
+        class C(object):
             def __init__(self):
-                self.foo = "bar"
+                calls.append(self.a)
+                self.extra = self.a
 
-        i = ImmuClass()
-        assert "bar" == i.foo
+        objs = [C(a=1), C(a=2)]
+        new = evolve_many(objs, a=3)
 
-    def test_with_init(self):
+        assert [1, 2] == calls
+        assert [3, 3] == [o.a for o in new]
+        assert [1, 2] == [o.extra for o in new]
+
+    def test_unset_slot(self):
         """
-        Changes in with_init's initializer are allowed.
+        Slots that aren't set stay unset.
         """
-        @immutable(["foo"])
-        @with_init(["foo"])
-        class ImmuClass(object):
+        @attributes(["a", Attribute("b", exclude_from_init=True)],
+                    storage="slots")
+        class C(object):
             pass
 
-        i = ImmuClass(foo="qux")
-        assert "qux" == i.foo
+        new, = evolve_many([C(a=1)], a=2)
 
-    def test_Attribute_exclude_from_immutable(self):
+        assert 2 == new.a
+        assert not hasattr(new, "b")
+
+    def test_mixed_classes(self):
         """
-        Ignores attribute if exclude_from_immutable=True.
+        Instances of different classes can be mixed.
         """
-        @immutable([Attribute("a", exclude_from_immutable=True), "b"])
+        @attributes(["a"], storage="tuple")
         class C(object):
-            def __init__(self, a, b):
-                self.a = a
-                self.b = b
+            pass
 
-        c = C(1, 2)
-        c.a = 3
+        new = evolve_many([Packable(a=1), C(a=1), Packable(a=3)], a=2)
+
+        assert [Packable(a=2), C(a=2), Packable(a=2)] == new
+
+    def test_validates_once(self):
+        """
+        Changed values are checked against instance_of.
+        """
+        with pytest.raises(TypeError) as e:
+            evolve_many([TuplePoint(x=1)], y="2")
+
+        assert (
+            "Attribute '_y' must be an instance of 'int'."
+        ) == e.value.args[0]
+
+    def test_unknown_argument(self):
+        """
+        Keyword arguments that don't belong to an attribute raise TypeError.
+        """
+        with pytest.raises(TypeError) as e:
+            evolve_many([Packable(a=1)], c=2)
+
+        assert (
+            "evolve_many() got an unexpected keyword argument 'c' for "
+            "'Packable'."
+        ) == e.value.args[0]
+
+    def test_empty(self):
+        """
+        No instances and no changes work.
+        """
+        assert [] == evolve_many([], a=1)
+        assert [Packable(a=1)] == evolve_many([Packable(a=1)])
+
+
+@attributes([Attribute("i", instance_of=int),
+             Attribute("f", instance_of=float),
+             Attribute("_b", instance_of=bool),
+             Attribute("derived", exclude_from_init=True)])
+class Fixed(object):
+    derived = None
+
+
+class TestRecords(object):
+    def test_record_struct(self):
+        """
+        The layout is derived from instance_of and skips attributes that
+        aren't initialized.
+        """
+        assert "<qd?" == record_struct(Fixed).format
+
+    def test_record_struct_not_fixed(self):
+        """
+        Raises TypeError if an attribute doesn't have a fixed size.
+        """
+        with pytest.raises(TypeError) as e:
+            record_struct(Typed)
+        assert (
+            "Attribute '_b' doesn't have a fixed-size instance_of."
+            == e.value.args[0]
+        )
+
+    def test_roundtrip(self, tmpdir):
+        """
+        Written records can be read back lazily and randomly.
+        """
+        objs = [Fixed(i=i, f=i / 2, b=bool(i % 2)) for i in range(5000)]
+        path = str(tmpdir.join("records"))
+        with open(path, "wb") as f:
+            assert 5000 == write_records(Fixed, iter(objs), f)
+        with open(path, "rb") as f:
+            with MappedRecords(Fixed, f) as records:
+                assert 5000 == len(records)
+                assert objs[42] == records[42]
+                assert objs[-1] == records[-1]
+                assert objs == list(records)
+                with pytest.raises(IndexError):
+                    records[5000]
+
+    def test_slices(self, tmpdir):
+        """
+        Slicing returns lists of records, other indices raise TypeError.
+        """
+        objs = [Fixed(i=i, f=i / 2, b=bool(i % 2)) for i in range(10)]
+        path = str(tmpdir.join("records"))
+        with open(path, "wb") as f:
+            write_records(Fixed, objs, f)
+        with open(path, "rb") as f:
+            with MappedRecords(Fixed, f) as records:
+                assert objs[2:5] == records[2:5]
+                assert objs[::-3] == records[::-3]
+                assert [] == records[20:]
+                with pytest.raises(TypeError) as e:
+                    records["1"]
+        assert (
+            "Record indices must be integers or slices, not str."
+            == e.value.args[0]
+        )
+
+    @pytest.mark.parametrize("size", [0, 3])
+    def test_close(self, tmpdir, size):
+        """
+        Closing is idempotent, also inside of the with block.  Closed records
+        can't be read anymore.
+        """
+        path = str(tmpdir.join("records"))
+        with open(path, "wb") as f:
+            write_records(
+                Fixed, [Fixed(i=i, f=0.0, b=True) for i in range(size)], f
+            )
+        with open(path, "rb") as f:
+            with MappedRecords(Fixed, f) as records:
+                records.close()
+                records.close()
+        with pytest.raises(ValueError) as e:
+            list(records)
+        assert "I/O operation on closed records." == e.value.args[0]
+        with pytest.raises(ValueError):
+            records[:]
+
+    def test_empty(self, tmpdir):
+        """
+        Empty files work.
+        """
+        path = str(tmpdir.join("records"))
+        with open(path, "wb") as f:
+            assert 0 == write_records(Fixed, [], f)
+        with open(path, "rb") as f:
+            with MappedRecords(Fixed, f) as records:
+                assert 0 == len(records)
+                assert [] == list(records)
+
+    def test_truncated(self, tmpdir):
+        """
+        Raises ValueError if the file doesn't consist of whole records.
+        """
+        path = str(tmpdir.join("records"))
+        with open(path, "wb") as f:
+            f.write(b"x" * 20)
+        with open(path, "rb") as f:
+            with pytest.raises(ValueError) as e:
+                MappedRecords(Fixed, f)
+        assert (
+            "File size 20 isn't a multiple of the record size 17."
+            == e.value.args[0]
+        )
+
+
+class FakePool(object):
+    """
+    Stands in for a multiprocessing pool.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def map(self, func, iterable, chunksize):
+        self.calls.append((list(iterable), chunksize))
+        return [func(item) for item in self.calls[-1][0]]
+
+
+class TestJSONLines(object):
+    def test_roundtrip(self):
+        """
+        Dumped instances are loaded as equal instances.
+        """
+        objs = [Packable(a=i, b=str(i)) for i in range(3000)]
+        f = io.StringIO()
+        assert 3000 == dump_jsonl(Packable, objs, f)
+        f.seek(0)
+        assert objs == list(load_jsonl(Packable, f))
+
+    def test_format(self):
+        """
+        Each line maps keyword argument names to values.  Attributes that
+        are excluded from with_init are left out.
+        """
+        f = io.StringIO()
+        dump_jsonl(Packable, iter([Packable(a=1)]), f)
+        line = f.getvalue()
+        assert line.endswith("\n")
+        assert {"a": 1, "b": 2} == json.loads(line)
+
+    def test_lazy(self):
+        """
+        Lines are read chunk by chunk only when the instances are consumed
+        and blank lines are skipped.
+        """
+        f = io.StringIO(u'\n{"a": 1}\n\n{"a": 2}\n')
+        objs = load_jsonl(Packable, f, chunksize=1)
+        assert Packable(a=1) == next(objs)
+        assert u'\n' == f.readline()
+        assert [Packable(a=2)] == list(objs)
+
+    def test_chunks(self):
+        """
+        Chunks that don't divide the number of lines work.
+        """
+        f = io.StringIO(u"".join(
+            u'{{"a": {0}}}\n'.format(i) for i in range(10)
+        ))
+        assert [
+            Packable(a=i) for i in range(10)
+        ] == list(load_jsonl(Packable, f, chunksize=3))
+
+    def test_pool(self, monkeypatch):
+        """
+        If a pool is passed, its map is used for parsing a bounded number of
+        chunks at a time, one chunk per task.
+        """
+        monkeypatch.setattr(characteristic, "_POOL_CHUNKS", 2)
+        pool = FakePool()
+        f = io.StringIO(u"".join(
+            u'{{"a": {0}, "b": 3}}\n'.format(i) for i in range(5)
+        ))
+        objs = load_jsonl(Packable, f, pool=pool, chunksize=2)
+
+        assert Packable(a=0, b=3) == next(objs)
+        assert 1 == len(pool.calls)
+        assert [
+            Packable(a=i, b=3) for i in range(1, 5)
+        ] == list(objs)
+        assert [
+            ([[u'{"a": 0, "b": 3}\n', u'{"a": 1, "b": 3}\n'],
+              [u'{"a": 2, "b": 3}\n', u'{"a": 3, "b": 3}\n']], 1),
+            ([[u'{"a": 4, "b": 3}\n']], 1),
+        ] == pool.calls
+
+
+class TestEmitModule(object):
+    @pytest.fixture
+    def models(self, tmpdir, monkeypatch):
+        """
+        Return the directory of a fresh importable module ``aot_models``.
+        """
+        tmpdir.join("aot_models.py").write(
+            "from characteristic import Attribute, attributes\n"
+            "\n"
+            "\n"
+            "@attributes(['a', Attribute('_b', default_value=1,\n"
+            "                            instance_of=int)],\n"
+            "            apply_immutable=True)\n"
+            "class C(object):\n"
+            "    pass\n"
+            "\n"
+            "\n"
+            "@attributes(['x'], storage='tuple')\n"
+            "class T(object):\n"
+            "    pass\n"
+        )
+        monkeypatch.syspath_prepend(str(tmpdir))
+        monkeypatch.setattr(characteristic, "_PRECOMPILED", {})
+        yield tmpdir
+        for name in ["aot_models", "aot_precompiled"]:
+            sys.modules.pop(name, None)
+
+    def test_precompiled(self, models):
+        """
+        Classes take their methods from an imported emitted module instead
+        of compiling them.
+        """
+        path = str(models.join("aot_precompiled.py"))
+        with io.open(path, "w") as f:
+            assert 3 == emit_module(["aot_models"], f)
+
+        del sys.modules["aot_models"]
+        import aot_precompiled
+        import aot_models
+        C, T = aot_models.C, aot_models.T
+
+        assert aot_precompiled.__file__ == C.__init__.__code__.co_filename
+        assert aot_precompiled.__file__ == T.__new__.__code__.co_filename
+        assert "characteristic_init" == C.__init__.__name__
+        assert (1, 2) == (C(a=1, b=2).a, C(a=1, b=2)._b)
+        assert C(a=1) == C(a=1)
+        with pytest.raises(TypeError):
+            C(a=1, b="2")
         with pytest.raises(AttributeError):
-            c.b = 4
+            C(a=1).a = 2
+        assert (3,) == T(x=3)
+
+    def test_stale(self, models):
+        """
+        Methods that aren't in the emitted module are generated as usual.
+        """
+        path = str(models.join("aot_precompiled.py"))
+        with io.open(path, "w") as f:
+            emit_module(["aot_models"], f)
+        import aot_precompiled  # noqa
+
+        @attributes(["y"])
+        class D(object):
+            pass
+
+        assert (
+            aot_precompiled.__file__ != D.__init__.__code__.co_filename
+        )
+        assert 1 == D(y=1).y
 
 
 class TestAttrsToScript(object):
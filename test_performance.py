@@ -0,0 +1,132 @@
+"""
+Relative performance budgets.
+
+Every test times an operation on decorated classes against the same operation
+on a hand-written or built-in equivalent and fails if it's slower than the
+budget allows.  Since only ratios are asserted, the budgets hold on any
+reasonably quiet machine.  They are generous on purpose: their job is to
+catch regressions like an accidental extra Python call per attribute, not to
+measure micro-optimizations.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import platform
+import sys
+import timeit
+
+import pytest
+
+from characteristic import attributes, diff
+
+
+# Maximum ratios between the time of the decorated and the plain operation.
+INIT_BUDGET = 4
+FROZEN_INIT_BUDGET = 3
+EQ_BUDGET = 15
+HASH_BUDGET = 8
+DIFF_BUDGET = 3
+
+pytestmark = pytest.mark.skipif(
+    sys.gettrace() is not None
+    or platform.python_implementation() != "CPython",
+    reason="Timings are only meaningful on CPython without tracing "
+           "(e.g. coverage).",
+)
+
+
+class Artisanal(object):
+    def __init__(self, a, b, c):
+        self.a = a
+        self.b = b
+        self.c = c
+
+
+@attributes(["a", "b", "c"])
+class Mutable(object):
+    pass
+
+
+@attributes(["a", "b", "c"], apply_immutable=True)
+class Frozen(object):
+    pass
+
+
+def best_time(func, number=20000, repeat=7):
+    """
+    Return the best time of *repeat* runs of calling *func* *number* times.
+
+    Taking the minimum filters out interruptions by other processes.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat))
+
+
+def ratio(func, baseline):
+    """
+    Return how many times slower *func* is than *baseline*.
+    """
+    return best_time(func) / best_time(baseline)
+
+
+def test_init():
+    """
+    The generated initializer isn't much slower than a hand-written one.
+    """
+    r = ratio(lambda: Mutable(a=1, b=2, c=3),
+              lambda: Artisanal(a=1, b=2, c=3))
+
+    assert r < INIT_BUDGET
+
+
+def test_frozen_init():
+    """
+    Immutable classes aren't much slower to instantiate than mutable ones.
+    """
+    r = ratio(lambda: Frozen(a=1, b=2, c=3),
+              lambda: Mutable(a=1, b=2, c=3))
+
+    assert r < FROZEN_INIT_BUDGET
+
+
+def test_eq():
+    """
+    Comparing instances isn't much slower than comparing tuples.
+    """
+    i1, i2 = Mutable(a=1, b=2, c=3), Mutable(a=1, b=2, c=3)
+    t1, t2 = (1, 2, 3), (1, 2, 3)
+
+    r = ratio(lambda: i1 == i2, lambda: t1 == t2)
+
+    assert r < EQ_BUDGET
+
+
+def test_hash():
+    """
+    Hashing instances isn't much slower than hashing tuples.
+    """
+    i = Mutable(a=1, b=2, c=3)
+    t = (1, 2, 3)
+
+    r = ratio(lambda: hash(i), lambda: hash(t))
+
+    assert r < HASH_BUDGET
+
+
+def test_diff():
+    """
+    Diffing instances isn't much slower than a hand-written loop.
+    """
+    i1, i2 = Mutable(a=1, b="x", c=3.0), Mutable(a=1, b="x", c=4.0)
+
+    def artisanal_diff(a, b):
+        rv = {}
+        for name in ("a", "b", "c"):
+            old = getattr(a, name)
+            new = getattr(b, name)
+            if old != new:
+                rv[name] = (old, new)
+        return rv
+
+    r = ratio(lambda: diff(i1, i2), lambda: artisanal_diff(i1, i2))
+
+    assert r < DIFF_BUDGET